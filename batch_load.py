@@ -1,5 +1,12 @@
+import argparse
 import psycopg2
+import redis
 import csv
+from bulk_copy import bulk_load, BULK_WORKERS, BULK_CHUNK_MB
+from setup_incremental_features import incremental_trigger_installed
+from feature_cache import INVALIDATION_CHANNEL, invalidation_message
+from feature_registry import USER_FEATURES_PATTERN
+from materialize import materialize
 
 # --- Database Connection Config ---
 # !! Replace 'your_password' with the password you set in your docker run command !!
@@ -9,33 +16,64 @@ DB_PASS = "Sanvi@123" # <--- ⚠️ CHANGE THIS
 DB_HOST = "127.0.0.1"  # This works because we published the port
 DB_PORT = "5433"
 
-def batch_load_data():
+def invalidate_online_features():
+    """Drop cached historical_avg copies in Redis and tell API workers to clear their L1 caches."""
+    try:
+        r = redis.Redis(host='127.0.0.1', port=6379, decode_responses=True)
+        pipe = r.pipeline(transaction=False)
+        for i, key in enumerate(r.scan_iter(match=USER_FEATURES_PATTERN, count=1000), 1):
+            pipe.hdel(key, "historical_avg")
+            if i % 1000 == 0: pipe.execute()
+        pipe.execute()
+        r.publish(INVALIDATION_CHANNEL, invalidation_message())
+        print("✅ Online feature caches invalidated.")
+    except Exception as e:
+        print(f"⚠️ Could not invalidate online feature caches: {e}")
+
+def refresh_online_features():
+    """Push the new historical_avg values to Redis; if that fails, just drop the stale ones."""
+    if materialize() is None: invalidate_online_features()
+
+def connect():
+    return psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASS,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+
+def batch_load_data(path='transactions.csv', parallel=False, workers=BULK_WORKERS, chunk_mb=BULK_CHUNK_MB):
     conn = None
     cur = None
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-            host=DB_HOST,
-            port=DB_PORT
-        )
+        conn = connect()
         cur = conn.cursor()
         print("✅ Database connection successful.")
 
         # === 1. Load transactions_log ===
         print("Loading data into 'transactions_log'...")
-        with open('transactions.csv', 'r') as f:
-            # Skip header row
-            next(f)
-            # Use COPY for bulk loading, it's very fast
-            cur.copy_expert(
-                "COPY transactions_log(user_id, amount, timestamp) FROM STDIN WITH CSV", f
-            )
-        conn.commit()
+        if parallel:
+            # Chunked COPY over several connections via a staging table; resumes on rerun
+            if bulk_load(connect, path, workers, chunk_mb)["skipped"]: return
+        else:
+            with open(path, 'r') as f:
+                # Skip header row
+                next(f)
+                # Use COPY for bulk loading, it's very fast
+                cur.copy_expert(
+                    "COPY transactions_log(user_id, amount, timestamp) FROM STDIN WITH CSV", f
+                )
+            conn.commit()
         print("✅ Successfully loaded into 'transactions_log'.")
 
         # === 2. Calculate and Load Historical Features ===
+        if incremental_trigger_installed(cur):
+            # The COPY above already folded the new rows into the running totals
+            print("✅ 'user_historical_features' updated incrementally by trigger.")
+            refresh_online_features()
+            return
+
         print("Calculating historical features...")
         calculate_features_sql = """
         INSERT INTO user_historical_features (user_id, total_spent, average_transaction_amount)
@@ -57,6 +95,7 @@ def batch_load_data():
         cur.execute(calculate_features_sql)
         conn.commit()
         print("✅ Successfully calculated and loaded 'user_historical_features'.")
+        refresh_online_features()
 
     except Exception as e:
         print(f"❌ An error occurred: {e}")
@@ -70,4 +109,10 @@ def batch_load_data():
         print("Database connection closed.")
 
 if __name__ == "__main__":
-    batch_load_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load a transactions CSV into Postgres and refresh historical features.")
+    parser.add_argument("path", nargs="?", default="transactions.csv")
+    parser.add_argument("--parallel", action="store_true", help="Chunked parallel COPY through a staging table (resumable)")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS, help="With --parallel: connections copying at once")
+    parser.add_argument("--chunk-mb", type=int, default=BULK_CHUNK_MB, help="With --parallel: chunk size")
+    args = parser.parse_args()
+    batch_load_data(args.path, args.parallel, args.workers, args.chunk_mb)
\ No newline at end of file
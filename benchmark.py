@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Offline benchmark suite ---
+# Drives the real FastAPI app in-process (full lifespan, middleware and pools,
+# requests sent through httpx's ASGI transport, so no network hop is measured)
+# against a local Postgres and either a local redis-server or an in-memory
+# Redis stand-in (fakeredis + lupa for the Lua scripts).
+#
+# The app is pointed at a separate database (BENCH_POSTGRES_DB) which is
+# rebuilt from transactions.csv scaled up --scale times, using the same setup
+# scripts as production. Results can be saved as a baseline and later runs
+# compared against it; a regression makes the script exit non-zero.
+#
+#   pip install -r requirements-dev.txt   # httpx, fakeredis, lupa on top of requirements.txt
+#   python benchmark.py --scale 20 --redis memory --save-baseline
+#   python benchmark.py --scale 20 --redis memory --compare
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DB = os.getenv("BENCH_POSTGRES_DB", "feature_store_bench")
+BASELINE_PATH = os.path.join(BASE_DIR, "benchmark_baseline.json")
+SOURCE_CSV = os.path.join(BASE_DIR, "transactions.csv")
+BENCH_COUPON = "BENCH10"
+
+SCHEMA_SQL = """
+DROP TABLE IF EXISTS transactions_log, user_historical_features, coupons CASCADE;
+CREATE TABLE transactions_log (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INT NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT now(),
+    is_flagged BOOLEAN NOT NULL DEFAULT FALSE
+);
+CREATE TABLE user_historical_features (
+    user_id INT PRIMARY KEY,
+    total_spent DECIMAL NOT NULL DEFAULT 0,
+    average_transaction_amount DECIMAL NOT NULL DEFAULT 0,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE coupons (
+    code VARCHAR(50) PRIMARY KEY,
+    discount_percent INT NOT NULL,
+    is_active BOOLEAN DEFAULT TRUE
+);
+"""
+
+
+def percentile(sorted_values, p):
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+# --- Data ---
+
+def scale_dataset(source, scale, out_path):
+    """Write `scale` copies of source to out_path, each copy shifted further into the past.
+
+    User ids are kept, so per-user history (and every analytics bucket count)
+    grows with the scale factor.
+    """
+    from csv_analytics import parse_csv
+    cols = parse_csv(source)
+    span = (cols.timestamp.max() - cols.timestamp.min()) + np.timedelta64(1, "D")
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("user_id,amount,timestamp\n")
+        for i in range(scale):
+            stamps = np.datetime_as_string(cols.timestamp - span * i, unit="s")
+            lines = [f"{u},{a:.2f},{t.replace('T', ' ')}" for u, a, t in zip(cols.user_id.tolist(), cols.amount.tolist(), stamps.tolist())]
+            f.write("\n".join(lines) + "\n")
+    return len(cols) * scale, np.unique(cols.user_id).tolist()
+
+
+def prepare_database(csv_path):
+    """(Re)create the benchmark database from csv_path using the production setup scripts."""
+    from db_pool import PG_USER, PG_PASS, PG_HOST, PG_PORT
+    admin = psycopg2.connect(dbname="postgres", user=PG_USER, password=PG_PASS, host=PG_HOST, port=PG_PORT)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (BENCH_DB,))
+        if cur.fetchone() is None:
+            cur.execute(f'CREATE DATABASE "{BENCH_DB}"')
+    admin.close()
+
+    conn = psycopg2.connect(dbname=BENCH_DB, user=PG_USER, password=PG_PASS, host=PG_HOST, port=PG_PORT)
+    with conn, conn.cursor() as cur:
+        cur.execute(SCHEMA_SQL)
+        with open(csv_path, "r", encoding="utf-8") as f:
+            next(f)
+            cur.copy_expert("COPY transactions_log(user_id, amount, timestamp) FROM STDIN WITH CSV", f)
+        cur.execute("INSERT INTO coupons (code, discount_percent, is_active) VALUES (%s, 10, TRUE)", (BENCH_COUPON,))
+    conn.close()
+
+    # Same steps as a production install (these modules read POSTGRES_DB, set in main())
+    from setup_incremental_features import create_incremental_features
+    from optimize_db import optimize_database
+    from setup_rollups import create_rollups
+    from setup_procedures import create_procedures
+    create_incremental_features()
+    optimize_database()
+    create_rollups()
+    create_procedures()
+
+
+def use_memory_redis():
+    """Make the app's pool factory hand out an in-process fakeredis client."""
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("❌ --redis memory needs fakeredis and lupa: pip install -r requirements-dev.txt")
+    import db_pool
+
+    async def create_memory_redis(*args, **kwargs):
+        server = fakeredis.FakeServer()
+        pool = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True).connection_pool
+        return db_pool.InstrumentedRedis(connection_pool=pool)
+
+    db_pool.create_redis_pool = create_memory_redis
+
+
+# --- Scenarios ---
+
+def build_scenarios(users, rng):
+    """name -> (method, make_request(i) -> (path, json body or None))."""
+    pick = lambda: rng.choice(users)
+    return {
+        "submit_approve": ("POST", lambda i: ("/submit-transaction", {"user_id": pick(), "amount": round(rng.uniform(5, 60), 2)})),
+        "submit_challenge": ("POST", lambda i: ("/submit-transaction", {"user_id": pick(), "amount": round(rng.uniform(5000, 9000), 2)})),
+        "features_online": ("GET", lambda i: (f"/features/{pick()}", None)),
+        "features_historical": ("GET", lambda i: (f"/features/historical/{pick()}", None)),
+        "analytics_all": ("GET", lambda i: ("/analytics/all", None)),
+        "analytics_csv": ("GET", lambda i: ("/analytics/from-csv?limit=100", None)),
+    }
+
+
+def check_response(name, response):
+    if response.status_code != 200: return False
+    if name == "submit_approve": return response.json().get("status") != "Challenge"
+    if name == "submit_challenge": return response.json().get("status") == "Challenge"
+    return True
+
+
+async def run_scenario(client, name, method, make_request, requests, concurrency, warmup):
+    for i in range(warmup):
+        path, body = make_request(i)
+        await client.request(method, path, json=body)
+
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            path, body = make_request(i)
+            started = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latencies.append(time.perf_counter() - started)
+            if not check_response(name, response): errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / wall, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def run_suite(users, csv_path, args):
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("❌ The benchmark needs httpx: pip install -r requirements-dev.txt")
+    import main
+    from csv_analytics import ColumnarCache
+    main.csv_cache = ColumnarCache(csv_path)
+
+    rng = random.Random(args.seed)
+    scenarios = build_scenarios(users, rng)
+    selected = args.scenarios or list(scenarios)
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        if main.pools.pg._pool is None:
+            sys.exit("❌ Postgres is not reachable; start a local server (POSTGRES_HOST/POSTGRES_PORT)")
+        if main.pools.redis is None:
+            sys.exit("❌ Redis is not reachable; start redis-server or use --redis memory")
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in selected:
+                method, make_request = scenarios[name]
+                results[name] = await run_scenario(client, name, method, make_request, args.requests, args.concurrency, args.warmup)
+                r = results[name]
+                print(f"  {name:<20} {r['throughput_rps']:>9.1f} req/s   p50 {r['p50_ms']:>8.2f} ms   "
+                      f"p95 {r['p95_ms']:>8.2f} ms   p99 {r['p99_ms']:>8.2f} ms   errors {r['errors']}")
+    return results
+
+
+# --- Baseline ---
+
+def compare(results, baseline, tolerance):
+    """Regressions vs the baseline: throughput down or p95/p99 up by more than `tolerance`."""
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None: continue
+        if current["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {current['throughput_rps']} req/s")
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {before[key]} -> {current[key]}")
+        if current["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the feature store API offline (needs requirements-dev.txt).")
+    parser.add_argument("--scale", type=int, default=10, help="Copies of transactions.csv to load (default 10)")
+    parser.add_argument("--redis", choices=["memory", "local"], default="memory", help="In-memory stand-in or the redis-server from REDIS_HOST/REDIS_PORT")
+    parser.add_argument("--requests", type=int, default=2000, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--scenarios", nargs="*", help="Subset of scenarios to run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-setup", action="store_true", help="Reuse the benchmark database from the last run")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write results to {os.path.basename(BASELINE_PATH)}")
+    parser.add_argument("--compare", action="store_true", help="Compare against the stored baseline, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before flagging (default 0.2)")
+    parser.add_argument("--output", help="Also write results JSON here")
+    args = parser.parse_args()
+
+    # Must happen before db_pool/main or the setup scripts are imported
+    os.environ["POSTGRES_DB"] = BENCH_DB
+    os.environ.setdefault("ROLLUP_REFRESH_INTERVAL", "1")
+    if args.redis == "memory":
+        use_memory_redis()
+
+    csv_path = os.path.join(BASE_DIR, f".bench_transactions_x{args.scale}.csv")
+    print(f"--- Preparing data: transactions.csv x{args.scale} ---")
+    rows, users = scale_dataset(SOURCE_CSV, args.scale, csv_path)
+    print(f"✅ {rows} rows, {len(users)} users -> {os.path.basename(csv_path)}")
+    if not args.skip_setup:
+        prepare_database(csv_path)
+        print(f"✅ Database '{BENCH_DB}' rebuilt.")
+
+    print(f"--- Running scenarios ({args.requests} requests, concurrency {args.concurrency}, redis={args.redis}) ---")
+    results = asyncio.run(run_suite(users, csv_path, args))
+
+    report = {
+        "meta": {"scale": args.scale, "rows": rows, "redis": args.redis, "requests": args.requests,
+                 "concurrency": args.concurrency, "python": platform.python_version(),
+                 "machine": platform.machine(), "created": time.strftime("%Y-%m-%d %H:%M:%S")},
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+
+    exit_code = 0
+    if args.compare:
+        try:
+            with open(BASELINE_PATH, "r", encoding="utf-8") as f: baseline = json.load(f)
+        except OSError:
+            sys.exit(f"❌ No baseline at {BASELINE_PATH}; run with --save-baseline first")
+        if {k: baseline["meta"].get(k) for k in ("scale", "redis", "concurrency")} != {k: report["meta"][k] for k in ("scale", "redis", "concurrency")}:
+            print("⚠️ Baseline was recorded with different --scale/--redis/--concurrency; comparison is indicative only.")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions: print(f"   {line}")
+            exit_code = 1
+        else:
+            print(f"✅ No regressions beyond {args.tolerance:.0%} vs baseline from {baseline['meta'].get('created')}.")
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+        print(f"✅ Baseline saved to {os.path.basename(BASELINE_PATH)}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import csv
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import psycopg2
+
+# --- Parallel, resumable COPY into transactions_log ---
+# 1. plan_chunks splits the CSV into byte ranges that end on a newline
+#    (rows must not contain embedded newlines, true for transactions.csv).
+# 2. Worker threads, one connection each, COPY the chunks into an UNLOGGED
+#    staging table. Each chunk's COPY and its bulk_load_chunks row commit
+#    together, so a rerun of the same file skips exactly the chunks that landed.
+# 3. A chunk whose COPY is rejected is re-parsed row by row: bad rows are
+#    counted (first error kept) and the rest is copied.
+# 4. merge() moves staging into transactions_log with one INSERT ... SELECT,
+#    so statement-level triggers (incremental features, rollups) fire once,
+#    then drops staging. A merged load is never applied twice.
+
+BULK_CHUNK_MB = int(os.getenv("BULK_CHUNK_MB", 64))
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", 4))
+COLUMNS = ("user_id", "amount", "timestamp")
+
+PROGRESS_SQL = """
+CREATE TABLE IF NOT EXISTS bulk_loads (
+    load_id VARCHAR(40) PRIMARY KEY,
+    path TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    chunks INT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'loading',
+    started_at TIMESTAMP NOT NULL DEFAULT now(),
+    merged_at TIMESTAMP,
+    merged_rows BIGINT
+);
+CREATE TABLE IF NOT EXISTS bulk_load_chunks (
+    load_id VARCHAR(40) NOT NULL REFERENCES bulk_loads(load_id) ON DELETE CASCADE,
+    chunk_no INT NOT NULL,
+    byte_start BIGINT NOT NULL,
+    byte_end BIGINT NOT NULL,
+    rows BIGINT NOT NULL,
+    errors INT NOT NULL DEFAULT 0,
+    first_error TEXT,
+    seconds REAL NOT NULL,
+    loaded_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (load_id, chunk_no)
+);
+"""
+
+
+def plan_chunks(path, chunk_bytes):
+    """[(start, end)] byte ranges covering the file after its header, each ending on a line boundary."""
+    size = os.path.getsize(path)
+    chunks = []
+    with open(path, "rb") as f:
+        f.readline()  # header
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            if f.tell() < size: f.readline()  # run on to the end of the current line
+            end = f.tell()
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def load_id_for(path, chunks):
+    """Same file, same size/mtime and same chunking -> same id, so a rerun resumes."""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{int(stat.st_mtime)}|{len(chunks)}|{chunks[0] if chunks else ''}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def staging_table(load_id):
+    return f"transactions_staging_{load_id[:12]}"
+
+
+def validate_rows(data):
+    """Split a chunk into (clean CSV text, error count, first error) by parsing every row."""
+    good = io.StringIO()
+    writer = csv.writer(good, lineterminator="\n")
+    errors = 0
+    first_error = None
+    for line_no, row in enumerate(csv.reader(io.StringIO(data.decode("utf-8", errors="replace"))), 1):
+        if not row: continue
+        try:
+            if len(row) != len(COLUMNS): raise ValueError(f"expected {len(COLUMNS)} columns, got {len(row)}")
+            user_id, amount, timestamp = int(row[0]), Decimal(row[1]), datetime.fromisoformat(row[2])
+            if not amount.is_finite(): raise ValueError(f"bad amount {row[1]!r}")
+        except (ValueError, InvalidOperation) as e:
+            errors += 1
+            if first_error is None: first_error = f"line {line_no} of chunk: {e}"
+            continue
+        writer.writerow((user_id, amount, timestamp.isoformat(sep=" ")))
+    good.seek(0)
+    return good, errors, first_error
+
+
+def copy_chunk(connect, path, load_id, chunk_no, start, end):
+    """COPY one byte range into staging and record it. Returns its bulk_load_chunks values."""
+    table = staging_table(load_id)
+    copy_sql = f"COPY {table} ({', '.join(COLUMNS)}) FROM STDIN WITH CSV"
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    started = time.perf_counter()
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        errors, first_error = 0, None
+        try:
+            cur.copy_expert(copy_sql, io.BytesIO(data))
+        except psycopg2.DataError:
+            # Something in the chunk is malformed: keep the valid rows, count the rest
+            conn.rollback()
+            good, errors, first_error = validate_rows(data)
+            cur.copy_expert(copy_sql, good)
+        rows = cur.rowcount
+        seconds = time.perf_counter() - started
+        cur.execute("""
+            INSERT INTO bulk_load_chunks (load_id, chunk_no, byte_start, byte_end, rows, errors, first_error, seconds)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (load_id, chunk_no, start, end, rows, errors, first_error, seconds))
+        conn.commit()
+        cur.close()
+        return {"chunk_no": chunk_no, "rows": rows, "errors": errors, "first_error": first_error, "seconds": seconds}
+    finally:
+        conn.close()
+
+
+def prepare(conn, path, chunks, load_id):
+    """Progress tables, the load's row and its staging table. Returns (status, chunk numbers already done)."""
+    with conn.cursor() as cur:
+        cur.execute(PROGRESS_SQL)
+        cur.execute("""
+            INSERT INTO bulk_loads (load_id, path, size, chunks) VALUES (%s, %s, %s, %s)
+            ON CONFLICT (load_id) DO NOTHING
+        """, (load_id, os.path.abspath(path), os.path.getsize(path), len(chunks)))
+        cur.execute("SELECT status FROM bulk_loads WHERE load_id = %s", (load_id,))
+        status = cur.fetchone()[0]
+        if status == "merged":
+            conn.commit()
+            return status, set()
+        # UNLOGGED: no WAL for rows that only live here until the merge
+        cur.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {staging_table(load_id)} AS
+            SELECT {', '.join(COLUMNS)} FROM transactions_log WITH NO DATA
+        """)
+        cur.execute("SELECT chunk_no FROM bulk_load_chunks WHERE load_id = %s", (load_id,))
+        done = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return status, done
+
+
+def merge(conn, load_id):
+    """Move the staged rows into transactions_log and drop staging, in one transaction. Returns rows merged."""
+    table = staging_table(load_id)
+    with conn.cursor() as cur:
+        cur.execute("SELECT status FROM bulk_loads WHERE load_id = %s FOR UPDATE", (load_id,))
+        if cur.fetchone()[0] == "merged": return 0
+        cur.execute(f"INSERT INTO transactions_log ({', '.join(COLUMNS)}) SELECT {', '.join(COLUMNS)} FROM {table}")
+        merged = cur.rowcount
+        cur.execute("UPDATE bulk_loads SET status = 'merged', merged_at = now(), merged_rows = %s WHERE load_id = %s", (merged, load_id))
+        cur.execute(f"DROP TABLE {table}")
+    conn.commit()
+    return merged
+
+
+def bulk_load(connect, path, workers=BULK_WORKERS, chunk_mb=BULK_CHUNK_MB):
+    """Load a transactions.csv-style file into transactions_log in parallel chunks.
+
+    connect() must return a new psycopg2 connection. Safe to rerun after a
+    failure: finished chunks are skipped. Returns a summary dict.
+    """
+    chunks = plan_chunks(path, chunk_mb * 1024 * 1024)
+    load_id = load_id_for(path, chunks)
+    conn = connect()
+    try:
+        status, done = prepare(conn, path, chunks, load_id)
+        if status == "merged":
+            print(f"ℹ️ {path} was already loaded (load {load_id[:12]}); nothing to do.")
+            return {"load_id": load_id, "rows": 0, "errors": 0, "merged": 0, "skipped": True}
+        todo = [(i, start, end) for i, (start, end) in enumerate(chunks) if i not in done]
+        if done: print(f"ℹ️ Resuming load {load_id[:12]}: {len(done)}/{len(chunks)} chunks already staged.")
+        print(f"Copying {len(todo)} chunks of up to {chunk_mb} MB with {workers} workers...")
+
+        started = time.perf_counter()
+        results, failures = [], []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(copy_chunk, connect, path, load_id, i, start, end): i for i, start, end in todo}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failures.append(i)
+                    print(f"❌ Chunk {i + 1}/{len(chunks)} failed: {e}")
+                    continue
+                results.append(result)
+                rate = result["rows"] / result["seconds"] if result["seconds"] else 0
+                note = f", {result['errors']} rejected ({result['first_error']})" if result["errors"] else ""
+                print(f"✅ Chunk {i + 1}/{len(chunks)}: {result['rows']} rows, {rate:,.0f} rows/sec{note}")
+        elapsed = time.perf_counter() - started
+        rows = sum(r["rows"] for r in results)
+        errors = sum(r["errors"] for r in results)
+        print(f"✅ Staged {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/sec), {errors} rows rejected.")
+        if failures:
+            raise RuntimeError(f"{len(failures)} chunks failed; rerun to retry just those")
+
+        print("Merging staging table into 'transactions_log'...")
+        merge_started = time.perf_counter()
+        merged = merge(conn, load_id)
+        print(f"✅ Merged {merged} rows in {time.perf_counter() - merge_started:.2f}s.")
+        return {"load_id": load_id, "rows": rows, "errors": errors, "merged": merged, "skipped": False,
+                "seconds": elapsed, "rows_per_sec": rows / elapsed if elapsed else 0.0}
+    finally:
+        conn.close()
@@ -0,0 +1,109 @@
+import csv
+import os
+import threading
+
+import numpy as np
+
+from serialization import dumps
+
+# --- Columnar cache for transactions.csv ---
+# The file is parsed once into three NumPy arrays (24 bytes/row) and only
+# re-parsed when its mtime or size changes. Filters and aggregations run
+# vectorized over the arrays instead of over lists of dicts.
+
+NDJSON_CHUNK_ROWS = 5000
+
+
+class TransactionColumns:
+    def __init__(self, user_id, amount, timestamp):
+        self.user_id = user_id        # int64
+        self.amount = amount          # float64
+        self.timestamp = timestamp    # datetime64[s]
+
+    def __len__(self):
+        return len(self.user_id)
+
+    def mask(self, user_id=None, start=None, end=None, min_amount=None, max_amount=None):
+        """Boolean row mask for the given filters (None = no filter)."""
+        keep = np.ones(len(self), dtype=bool)
+        if user_id is not None: keep &= self.user_id == user_id
+        if start is not None: keep &= self.timestamp >= np.datetime64(start, "s")
+        if end is not None: keep &= self.timestamp < np.datetime64(end, "s")
+        if min_amount is not None: keep &= self.amount >= min_amount
+        if max_amount is not None: keep &= self.amount <= max_amount
+        return keep
+
+    def rows(self, index):
+        """Materialize the selected rows as dicts (only for the page being returned)."""
+        # Whole-column conversions (tolist, datetime_as_string) instead of per-value numpy scalars
+        stamps = np.datetime_as_string(self.timestamp[index], unit="s")
+        return [
+            {"user_id": u, "amount": a, "timestamp": t.replace("T", " ")}
+            for u, a, t in zip(self.user_id[index].tolist(), self.amount[index].tolist(), stamps.tolist())
+        ]
+
+    def iter_ndjson(self, index, chunk_rows=NDJSON_CHUNK_ROWS):
+        for i in range(0, len(index), chunk_rows):
+            yield b"".join(dumps(row) + b"\n" for row in self.rows(index[i:i + chunk_rows]))
+
+    def daily_totals(self, keep):
+        days = self.timestamp[keep].astype("datetime64[D]")
+        unique_days, inverse = np.unique(days, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.amount[keep], minlength=len(unique_days))
+        counts = np.bincount(inverse, minlength=len(unique_days))
+        return [{"day": str(d), "sales": round(float(s), 2), "tx_count": int(c)}
+                for d, s, c in zip(unique_days, totals, counts)]
+
+    def user_totals(self, keep, top=None):
+        unique_users, inverse = np.unique(self.user_id[keep], return_inverse=True)
+        totals = np.bincount(inverse, weights=self.amount[keep], minlength=len(unique_users))
+        counts = np.bincount(inverse, minlength=len(unique_users))
+        order = np.argsort(-totals, kind="stable")
+        if top is not None: order = order[:top]
+        return [{"user_id": int(unique_users[i]), "total": round(float(totals[i]), 2), "tx_count": int(counts[i])}
+                for i in order]
+
+
+def parse_csv(path):
+    with open(path, "r", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # header
+        users, amounts, stamps = [], [], []
+        for row in reader:
+            if len(row) < 3: continue
+            users.append(row[0]); amounts.append(row[1]); stamps.append(row[2])
+    try:
+        # Fast path: convert whole columns at once
+        return TransactionColumns(np.array(users, dtype=np.int64), np.array(amounts, dtype=np.float64),
+                                  np.array(stamps, dtype="datetime64[s]"))
+    except ValueError:
+        # Some rows are malformed: fall back to per-row parsing and skip them
+        good = []
+        for u, a, t in zip(users, amounts, stamps):
+            try: good.append((int(u), float(a), np.datetime64(t, "s")))
+            except ValueError: continue
+        if not good:
+            return TransactionColumns(np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, "datetime64[s]"))
+        u, a, t = zip(*good)
+        return TransactionColumns(np.array(u, dtype=np.int64), np.array(a, dtype=np.float64),
+                                  np.array(t, dtype="datetime64[s]"))
+
+
+class ColumnarCache:
+    """Parses a CSV on first use and again only after the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._columns = None
+
+    def get(self):
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if self._stamp != stamp:
+            with self._lock:
+                if self._stamp != stamp:
+                    self._columns = parse_csv(self.path)
+                    self._stamp = stamp
+        return self._columns
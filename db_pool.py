@@ -0,0 +1,287 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import psycopg2
+import redis.asyncio as aioredis
+from psycopg2.pool import ThreadedConnectionPool
+from redis.asyncio.client import Pipeline
+from dotenv import load_dotenv
+
+from metrics import PG_ACQUIRE_SECONDS, PG_QUERY_SECONDS, REDIS_ACQUIRE_SECONDS, REDIS_COMMAND_SECONDS
+
+load_dotenv()
+
+# --- Config ---
+REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+PG_DBNAME = os.getenv("POSTGRES_DB", "feature_store")
+PG_USER = os.getenv("POSTGRES_USER", "postgres")
+PG_PASS = os.getenv("POSTGRES_PASSWORD")
+PG_HOST = os.getenv("POSTGRES_HOST", "127.0.0.1")
+PG_PORT = os.getenv("POSTGRES_PORT", "5433")
+
+# Pool sizing / timeouts (seconds)
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", 2))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", 20))
+PG_ACQUIRE_TIMEOUT = float(os.getenv("PG_ACQUIRE_TIMEOUT", 5))
+PG_HEALTH_CHECK_INTERVAL = float(os.getenv("PG_HEALTH_CHECK_INTERVAL", 30))
+REDIS_POOL_MIN = int(os.getenv("REDIS_POOL_MIN", 2))
+REDIS_POOL_MAX = int(os.getenv("REDIS_POOL_MAX", 50))
+REDIS_ACQUIRE_TIMEOUT = float(os.getenv("REDIS_ACQUIRE_TIMEOUT", 5))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the acquire timeout."""
+
+
+class PgPool:
+    """Async front for a psycopg2 ThreadedConnectionPool.
+
+    psycopg2 is blocking, so every query runs in a worker thread of the
+    pool's own executor (max_size threads, one per connection); the event
+    loop only ever awaits. A semaphore caps checkouts at max_size so callers
+    wait (up to acquire_timeout) instead of failing when the pool is busy.
+    Thread work is shielded from cancellation: if the awaiting task is
+    cancelled (client disconnect, timeout), the connection is only checked
+    back in, from the worker thread, once that work has finished.
+    """
+
+    def __init__(self, min_size=PG_POOL_MIN, max_size=PG_POOL_MAX,
+                 acquire_timeout=PG_ACQUIRE_TIMEOUT,
+                 health_check_interval=PG_HEALTH_CHECK_INTERVAL, **conn_kwargs):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.conn_kwargs = conn_kwargs or dict(
+            dbname=PG_DBNAME, user=PG_USER, password=PG_PASS, host=PG_HOST, port=PG_PORT
+        )
+        self._pool = None
+        self._executor = None
+        self._slots = asyncio.Semaphore(max_size)
+        self._open_lock = asyncio.Lock()
+        self._last_used = {}
+        self._busy = {}  # connection -> concurrent future of the thread work using it
+
+    def _submit(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_size, thread_name_prefix="pg")
+        return self._executor.submit(fn, *args)
+
+    async def open(self):
+        async with self._open_lock:
+            if self._pool is None:
+                self._pool = await asyncio.wrap_future(self._submit(
+                    lambda: ThreadedConnectionPool(self.min_size, self.max_size, **self.conn_kwargs)
+                ))
+
+    async def close(self):
+        if self._pool:
+            await asyncio.wrap_future(self._submit(self._pool.closeall))
+        self._pool = None
+        self._last_used.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _checkout(self):
+        conn = self._pool.getconn()
+        # Health check: validate connections that have sat idle for a while
+        idle = time.monotonic() - self._last_used.get(id(conn), 0)
+        if conn.closed or idle > self.health_check_interval:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        return conn
+
+    def _checkin(self, conn, broken=False):
+        self._last_used[id(conn)] = time.monotonic()
+        self._pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def _release_when_done(self, work, loop, checkin):
+        """Once the (still running) thread work finishes: checkin() in that thread, then free the slot."""
+        def release(_):
+            try: checkin()
+            finally: loop.call_soon_threadsafe(self._slots.release)
+        work.add_done_callback(release)
+
+    def _rollback_and_checkin(self, conn):
+        # The abandoned caller may have left a transaction or named cursor open
+        try:
+            if not conn.closed: conn.rollback()
+            self._checkin(conn)
+        except psycopg2.Error:
+            self._checkin(conn, broken=True)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Check out a raw connection. Use it from the pool's threads via call() (see run())."""
+        if self._pool is None:
+            # Postgres was down at startup; retry lazily
+            await self.open()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"No Postgres connection free after {self.acquire_timeout}s")
+        loop = asyncio.get_running_loop()
+        checkout = self._submit(self._checkout)
+        try:
+            conn = await asyncio.shield(asyncio.wrap_future(checkout))
+        except asyncio.CancelledError:
+            # The checkout still completes in its thread; give that connection straight back
+            self._release_when_done(checkout, loop, lambda: checkout.exception() or self._checkin(checkout.result()))
+            raise
+        except BaseException:
+            self._slots.release()
+            raise
+        PG_ACQUIRE_SECONDS.observe(time.perf_counter() - started)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            work = self._busy.pop(conn, None)
+            if work is not None and not work.done():
+                # Cancelled mid-call: a thread still owns the connection
+                self._release_when_done(work, loop, lambda: self._rollback_and_checkin(conn))
+            else:
+                self._checkin(conn, broken)
+                self._slots.release()
+
+    async def call(self, conn, fn, *args):
+        """Run blocking fn(*args) on the pool's executor for a connection from connection().
+
+        Calls on one connection run one at a time, and cancelling the caller
+        never interrupts the thread (the connection is released after it).
+        """
+        pending = self._busy.get(conn)
+        if pending is not None and not pending.done():
+            await asyncio.wait([asyncio.wrap_future(pending)])
+        work = self._busy[conn] = self._submit(fn, *args)
+        return await asyncio.shield(asyncio.wrap_future(work))
+
+    async def run(self, fn, *args, op=None):
+        """Run fn(conn, *args) in a worker thread; commit on success, rollback on error.
+
+        Timed under the `op` label (defaults to fn's name).
+        """
+        async with self.connection() as conn:
+            def work():
+                try:
+                    result = fn(conn, *args)
+                    conn.commit()
+                    return result
+                except Exception:
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+            with PG_QUERY_SECONDS.time(op or fn.__name__):
+                return await self.call(conn, work)
+
+    async def fetchone(self, sql, params=None):
+        def work(conn):
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.fetchone()
+        return await self.run(work, op="fetchone")
+
+    async def fetchall(self, sql, params=None):
+        def work(conn):
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.fetchall()
+        return await self.run(work, op="fetchall")
+
+    async def execute(self, sql, params=None):
+        def work(conn):
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.rowcount
+        return await self.run(work, op="execute")
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error=True):
+        with REDIS_COMMAND_SECONDS.time("PIPELINE"):
+            return await super().execute(raise_on_error)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """redis.asyncio client that times every command and pipeline round trip."""
+
+    async def execute_command(self, *args, **options):
+        with REDIS_COMMAND_SECONDS.time(str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedBlockingPool(aioredis.BlockingConnectionPool):
+    """Blocking pool that times how long callers wait for a connection."""
+
+    async def get_connection(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        finally:
+            REDIS_ACQUIRE_SECONDS.observe(time.perf_counter() - started)
+
+
+async def create_redis_pool(min_size=REDIS_POOL_MIN, max_size=REDIS_POOL_MAX,
+                            acquire_timeout=REDIS_ACQUIRE_TIMEOUT,
+                            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL):
+    """Async Redis client on a blocking pool: callers wait for a free connection."""
+    pool = InstrumentedBlockingPool(
+        host=REDIS_HOST, port=REDIS_PORT, decode_responses=True,
+        max_connections=max_size, timeout=acquire_timeout,
+        health_check_interval=health_check_interval,
+    )
+    client = InstrumentedRedis(connection_pool=pool)
+    # Pre-open min_size connections so the first requests skip TCP setup
+    conns = [await pool.get_connection() for _ in range(min_size)]
+    for conn in conns:
+        await pool.release(conn)
+    await client.ping()
+    return client
+
+
+class Pools:
+    """Holds the shared Postgres/Redis pools for the app lifespan."""
+
+    def __init__(self):
+        self.pg = PgPool()
+        self.redis = None
+
+    async def open(self):
+        try:
+            await self.pg.open()
+            print("✅ Postgres pool ready.")
+        except Exception as e:
+            print(f"❌ Postgres Error: {e}")
+        try:
+            self.redis = await create_redis_pool()
+            print("✅ Connected to Redis.")
+        except Exception as e:
+            print(f"❌ Redis Error: {e}")
+            self.redis = None
+
+    async def close(self):
+        await self.pg.close()
+        if self.redis is not None:
+            await self.redis.aclose(close_connection_pool=True)
+            self.redis = None
+
+
+pools = Pools()
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from metrics import REGISTRY
+
+# --- In-process L1 cache for slowly changing features ---
+# Sits in front of Redis inside each API worker. Entries expire after a TTL
+# and the least recently used entry is evicted once max_size is reached.
+# Whoever recomputes historical features publishes the affected user ids
+# (or "*") on INVALIDATION_CHANNEL so every worker drops its copies.
+
+# --- Read-through coalescing ---
+# A miss is loaded once however many requests want it: SingleFlight joins
+# callers inside a worker, and load_with_lease lets one worker per key take a
+# short Redis lock while the rest poll Redis for the value it writes. A lock
+# whose holder died just runs out after FEATURE_LOCK_LEASE seconds.
+
+L1_CACHE_SIZE = int(os.getenv("L1_CACHE_SIZE", 100000))
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", 300))
+INVALIDATION_CHANNEL = "feature_invalidation"
+INVALIDATE_ALL = "*"
+FEATURE_LOCK_LEASE = float(os.getenv("FEATURE_LOCK_LEASE", 2))
+FEATURE_LOCK_POLL = float(os.getenv("FEATURE_LOCK_POLL", 0.02))
+FEATURE_LOCK_KEY = "lock:feature_load:{key}"  # default; pass lock_key to namespace by feature
+
+FEATURE_LOADS = REGISTRY.counter("feature_loads_total", "Read-through keys by how they were resolved", labels=("result",))
+
+# Delete only the locks still holding our token (an expired lease may have been re-taken)
+RELEASE_LOCKS_LUA = """
+local released = 0
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then released = released + redis.call('DEL', key) end
+end
+return released
+"""
+
+
+class L1Cache:
+    def __init__(self, max_size=L1_CACHE_SIZE, ttl=L1_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None: del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        if self._data.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._data)
+        self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self._data), "max_size": self.max_size, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+class SingleFlight:
+    """Coalesces concurrent loads of the same keys inside one worker.
+
+    The load runs as its own task, so a caller that is cancelled (client gone)
+    doesn't cancel it for the others waiting on it.
+    """
+
+    def __init__(self):
+        self._flights = {}     # key -> task loading it
+        self._background = set()
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def load_many(self, keys, loader):
+        """{key: value} for keys, where `await loader(missing_keys)` returns {key: value}.
+
+        Keys already being loaded are joined instead of loaded again.
+        """
+        keys = list(dict.fromkeys(keys))
+        tasks = {key: self._flights.get(key) for key in keys}
+        mine = [key for key, task in tasks.items() if task is None]
+        if mine:
+            task = asyncio.ensure_future(loader(mine))
+            for key in mine: self._flights[key] = tasks[key] = task
+            task.add_done_callback(lambda t, ks=mine: self._land(t, ks))
+        FEATURE_LOADS.inc("coalesced", amount=len(keys) - len(mine))
+        results = {}
+        for task in set(tasks.values()): results.update(await asyncio.shield(task))
+        return {key: results.get(key) for key in keys}
+
+    def refresh(self, keys, loader):
+        """Fire-and-forget load_many, for stale-while-revalidate."""
+        keys = [key for key in keys if key not in self._flights]
+        if not keys: return
+        task = asyncio.ensure_future(self.load_many(keys, loader))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def _land(self, task, keys):
+        for key in keys:
+            if self._flights.get(key) is task: del self._flights[key]
+        if not task.cancelled(): task.exception()  # mark retrieved even if every caller left
+
+
+async def load_with_lease(r, keys, load, poll, wait=True, lock_key=FEATURE_LOCK_KEY,
+                          lease=FEATURE_LOCK_LEASE, poll_interval=FEATURE_LOCK_POLL):
+    """Cross-worker half of the coalescing: only the lock holder runs load() for a key.
+
+    load(keys) and poll(keys) both return {key: value}; poll() reads what the
+    holder wrote and leaves out keys that aren't there yet. Keys locked by
+    another worker are polled, and taken over if that lock is released or
+    expires without a value showing up. With wait=False they are skipped
+    instead (background refreshes).
+    """
+    token = uuid.uuid4().hex
+    out = {}
+    waiting = list(keys)
+    deadline = time.monotonic() + 2 * lease
+    while time.monotonic() < deadline:
+        pipe = r.pipeline(transaction=False)
+        for key in waiting: pipe.set(lock_key.format(key=key), token, nx=True, px=int(lease * 1000))
+        won = [key for key, ok in zip(waiting, await pipe.execute()) if ok]
+        if won:
+            FEATURE_LOADS.inc("loaded", amount=len(won))
+            try: out.update(await load(won))
+            finally: await r.eval(RELEASE_LOCKS_LUA, len(won), *(lock_key.format(key=key) for key in won), token)
+            waiting = [key for key in waiting if key not in won]
+        if not waiting or not wait: return out
+        await asyncio.sleep(poll_interval)
+        found = await poll(waiting)
+        FEATURE_LOADS.inc("waited", amount=len(found))
+        out.update(found)
+        waiting = [key for key in waiting if key not in found]
+        if not waiting: return out
+    # Locks keep getting re-taken without a value appearing: stop waiting
+    FEATURE_LOADS.inc("lease_expired", amount=len(waiting))
+    out.update(await load(waiting))
+    return out
+
+
+def invalidation_message(user_ids=None):
+    """Payload for INVALIDATION_CHANNEL: comma-separated user ids, or '*' for everything."""
+    if user_ids is None: return INVALIDATE_ALL
+    return ",".join(str(u) for u in user_ids)
+
+
+def apply_invalidation(cache, message):
+    if message == INVALIDATE_ALL:
+        cache.clear()
+        return
+    for part in message.split(","):
+        if part.strip(): cache.invalidate(int(part))
+
+
+async def listen_for_invalidations(get_redis, cache, retry_delay=1.0):
+    """Background task: apply invalidation messages to cache until cancelled.
+
+    Reconnects after Redis errors and clears the cache on every (re)subscribe,
+    since messages sent while disconnected are lost.
+    """
+    while True:
+        r = get_redis()
+        if r is None:
+            await asyncio.sleep(retry_delay)
+            continue
+        pubsub = r.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            cache.clear()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    apply_invalidation(cache, message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Cache invalidation listener error: {e}")
+            await asyncio.sleep(retry_delay)
+        finally:
+            try: await pubsub.aclose()
+            except Exception: pass
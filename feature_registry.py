@@ -0,0 +1,448 @@
+import argparse
+import os
+import struct
+import time
+
+from redis.client import NEVER_DECODE
+
+from windowed_features import SlidingWindows, RECORD_LUA
+
+# --- Feature registry and per-user hash layout ---
+# Every online feature is declared here once: name, type, TTL and source.
+# All of a user's online state lives in ONE Redis hash, USER_FEATURES_KEY:
+#   last_transaction_amount -> b"\x01" + float64          (binary packed, little endian)
+#   historical_avg          -> b"\x01" + float64 + uint32  (+ expires_at, features with a TTL)
+#   last_transaction_ts     -> event time (epoch seconds, text) of the stream values
+#   5m:17, 1h:3, ...        -> velocity buckets, text (see windowed_features.py)
+# so a read is one HGETALL/HMGET and a write one HSET (+ EXPIRE in the same
+# pipeline). Reads go through fetch(), which skips the client's UTF-8 decoding;
+# values are unpacked straight from the bytes. Text values written before the
+# binary format (no \x01 tag) are still understood.
+# The whole hash expires USER_FEATURES_TTL after the user's last write.
+#
+# The layout is sized to stay in Redis's compact listpack encoding: at most
+# HASH_MAX_LISTPACK_ENTRIES fields (Redis default 128; by default 3 horizons x
+# 30 buckets + the scalars and event time = 93). A hash past the limit silently turns into a
+# full hashtable, several times larger, so the registry warns at import if the
+# configured windows/buckets can exceed it, and `python feature_registry.py
+# --report` checks the encoding of real hashes against the server's limits.
+#
+# Sources:
+#   stream  - written by the API / pipeline on every transaction
+#   batch   - copied from Postgres (user_historical_features), refreshed after writes
+#   window  - computed from the velocity buckets in the same hash
+#   offline - Postgres only, never stored in Redis
+#
+# A transaction reaches the online store through apply_transactions(): one
+# EVALSHA that writes every stream feature, bumps the velocity buckets and
+# refreshes the TTL atomically, for one transaction or a whole batch. With an
+# idempotency key the script first claims IDEMPOTENCY_KEY for IDEMPOTENCY_TTL
+# seconds, so a retried request is applied once. The key holds "applied"; if
+# the caller then fails to store the row it marks the key "unstored"
+# (mark_unstored), and the next retry claims it back without touching the
+# features again (status RESUMED): it only has to store the row.
+#
+# Stream (derived) features keep the newest event: they are only overwritten
+# by a transaction whose timestamp is >= last_transaction_ts, so late or
+# replayed events still count in the windows but don't roll values back.
+
+USER_FEATURES_KEY = "user:{user_id}:features"
+USER_FEATURES_PATTERN = "user:*:features"
+USER_FEATURES_TTL = int(os.getenv("USER_FEATURES_TTL", 30 * 86400))
+HISTORICAL_AVG_TTL = int(os.getenv("HISTORICAL_AVG_TTL", 86400))
+# Stale-while-revalidate: an expired value is still served for this long while one caller reloads it
+FEATURE_STALE_TTL = int(os.getenv("FEATURE_STALE_TTL", 300))
+PACKED_TAG = b"\x01"
+IDEMPOTENCY_KEY = "idempotency:tx:{key}"
+LAST_EVENT_FIELD = "last_transaction_ts"
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 86400))
+# apply_transactions() statuses
+DUPLICATE, APPLIED, RESUMED = 0, 1, 2
+# Must match the server's hash-max-listpack-entries (Redis default)
+HASH_MAX_LISTPACK_ENTRIES = int(os.getenv("REDIS_HASH_MAX_LISTPACK_ENTRIES", 128))
+
+# KEYS: feature hash, idempotency key (per transaction)
+# ARGV: key_ttl, dedup_ttl, event time field, #fields, field names..., #horizon args, horizon args...,
+#       then per transaction: ts, amount, has_idempotency_key, field values...
+# Returns one status per transaction: 1 applied, 0 duplicate, 2 resumed (an
+# earlier attempt applied the features but did not store the row).
+APPLY_SCRIPT = RECORD_LUA + """
+local key_ttl, dedup_ttl, event_field = ARGV[1], ARGV[2], ARGV[3]
+local nf = tonumber(ARGV[4])
+local fields = {}
+for i = 1, nf do fields[i] = ARGV[4 + i] end
+local pos = 5 + nf
+local horizons = {}
+for i = 1, tonumber(ARGV[pos]) do horizons[i] = ARGV[pos + i] end
+pos = pos + #horizons + 1
+local applied = {}
+for t = 1, #KEYS, 2 do
+    local key = KEYS[t]
+    local status = 1
+    if ARGV[pos + 2] == '1' then
+        local state = redis.call('GET', KEYS[t + 1])
+        if not state then
+            redis.call('SET', KEYS[t + 1], 'applied', 'EX', dedup_ttl)
+        elseif state == 'unstored' then
+            redis.call('SET', KEYS[t + 1], 'applied', 'KEEPTTL')
+            status = 2
+        else
+            status = 0
+        end
+    end
+    if status == 1 then
+        local last = redis.call('HGET', key, event_field)
+        if not last or tonumber(ARGV[pos]) >= tonumber(last) then
+            for i = 1, nf do redis.call('HSET', key, fields[i], ARGV[pos + 2 + i]) end
+            redis.call('HSET', key, event_field, ARGV[pos])
+        end
+        record_velocity(key, tonumber(ARGV[pos]), tonumber(ARGV[pos + 1]), horizons)
+        redis.call('EXPIRE', key, key_ttl)
+    end
+    applied[#applied + 1] = status
+    pos = pos + 3 + nf
+end
+return applied
+"""
+
+
+class Feature:
+    def __init__(self, name, dtype=float, source="stream", ttl=None, default=None, description="", legacy_key=None,
+                 derive=None):
+        self.name = name
+        self.dtype = dtype
+        self.source = source
+        self.ttl = ttl              # seconds a written value stays valid; None = until overwritten
+        self.default = default
+        self.description = description
+        self.legacy_key = legacy_key  # pre-registry string key, for the migration
+        self.derive = derive          # stream features: (amount, ts) -> value, written per transaction
+        self.field = name.encode()
+        self._packer = struct.Struct("<" + ("d" if dtype is float else "q") + ("I" if ttl else ""))
+
+    @property
+    def stored(self):
+        """True if the value is a field of the user hash (as opposed to computed or offline)."""
+        return self.source in ("stream", "batch")
+
+    def encode(self, value, now=None):
+        value = round(float(value), 4) if self.dtype is float else int(value)
+        if self.ttl is None: return PACKED_TAG + self._packer.pack(value)
+        return PACKED_TAG + self._packer.pack(value, int((time.time() if now is None else now) + self.ttl))
+
+    def decode(self, raw, now=None):
+        """Stored bytes -> typed value, or None if missing or past its TTL."""
+        if raw is None: return None
+        if raw[:1] == PACKED_TAG:
+            unpacked = self._packer.unpack_from(raw, 1)
+            if self.ttl is not None and unpacked[1] <= (time.time() if now is None else now): return None
+            return unpacked[0]
+        # Legacy text value ("42.5" or "42.5|expires_at")
+        if isinstance(raw, bytes): raw = raw.decode()
+        raw, _, expires = raw.partition("|")
+        if expires and int(expires) <= (time.time() if now is None else now): return None
+        return self.dtype(raw)
+
+
+class FeatureRegistry:
+    def __init__(self, features, velocity, key=USER_FEATURES_KEY, key_ttl=USER_FEATURES_TTL):
+        self.features = {f.name: f for f in features}
+        self.velocity = velocity
+        self.key_template = key
+        self.key_ttl = key_ttl
+        self._scripts = {}
+        if self.max_fields > HASH_MAX_LISTPACK_ENTRIES:
+            print(f"⚠️ Per-user feature hashes can reach {self.max_fields} fields, over hash-max-listpack-entries "
+                  f"({HASH_MAX_LISTPACK_ENTRIES}); lower VELOCITY_BUCKETS or VELOCITY_WINDOWS to keep them compact "
+                  f"(then run --migrate to drop the old buckets).")
+
+    def __getitem__(self, name):
+        return self.features[name]
+
+    def __contains__(self, name):
+        return name in self.features
+
+    @property
+    def max_fields(self):
+        """Most fields one user's hash can hold: stored features, the event time and every velocity bucket."""
+        return sum(1 for f in self.features.values() if f.stored) + 1 + self.velocity.fields
+
+    def names(self, *sources):
+        return [name for name, f in self.features.items() if not sources or f.source in sources]
+
+    def key(self, user_id):
+        return self.key_template.format(user_id=user_id)
+
+    def fetch(self, pipe, user_id, fields=None):
+        """Queue a raw (undecoded) HGETALL, or HMGET of fields, for read().
+
+        Use a non-transactional pipeline: MULTI/EXEC replies are always decoded.
+        """
+        if fields is None: return pipe.execute_command("HGETALL", self.key(user_id), **{NEVER_DECODE: True})
+        return pipe.execute_command("HMGET", self.key(user_id), *fields, **{NEVER_DECODE: True})
+
+    def write(self, pipe, user_id, values, now=None):
+        """Queue HSET of {feature: value} plus the key TTL refresh on pipe."""
+        key = self.key(user_id)
+        pipe.hset(key, mapping={name: self.features[name].encode(v, now) for name, v in values.items()})
+        pipe.expire(key, self.key_ttl)
+
+    def _script_for(self, client):
+        script = self._scripts.get(id(client))
+        if script is None:
+            script = self._scripts[id(client)] = client.register_script(APPLY_SCRIPT)
+        return script
+
+    def preload(self, client):
+        """SCRIPT LOAD the transaction script so the first EVALSHA doesn't miss (await for asyncio clients)."""
+        return client.script_load(APPLY_SCRIPT)
+
+    def apply_transactions(self, client, transactions, pipe=None, dedup_ttl=IDEMPOTENCY_TTL):
+        """Apply [(user_id, amount, ts, idempotency_key or None), ...] to the online store in one call.
+
+        Works with both sync and asyncio redis clients (await the result for
+        the latter); pass pipe= to queue it on an open pipeline. Returns one
+        status per transaction: APPLIED, DUPLICATE (skipped), or RESUMED (the
+        features were applied by an earlier attempt whose row was not stored;
+        only the row still needs storing).
+        """
+        derived = [f for f in self.features.values() if f.derive is not None]
+        horizons = self.velocity.horizon_args()
+        keys = []
+        args = [max(self.key_ttl, self.velocity.ttl), dedup_ttl, LAST_EVENT_FIELD, len(derived), *(f.name for f in derived),
+                len(horizons), *horizons]
+        for user_id, amount, ts, idempotency_key in transactions:
+            key = self.key(user_id)
+            # Without a key the second slot is never touched; reuse the hash key as a placeholder
+            keys += [key, IDEMPOTENCY_KEY.format(key=idempotency_key) if idempotency_key else key]
+            args += [ts, amount, 1 if idempotency_key else 0, *(f.encode(f.derive(amount, ts), ts) for f in derived)]
+        return self._script_for(client)(keys=keys, args=args, client=pipe)
+
+    def mark_unstored(self, client, idempotency_key):
+        """The row of an applied transaction could not be stored: let a retry with this key store it."""
+        return client.set(IDEMPOTENCY_KEY.format(key=idempotency_key), "unstored", xx=True, keepttl=True)
+
+    def read(self, raw, wanted=None, now=None, stale=None):
+        """fetch() result -> {feature: value} for stored and window features.
+
+        raw is the HGETALL dict, or {field: value} zipped from HMGET. Missing
+        or expired stored features come back as their default. If a set is
+        passed as stale, values expired less than FEATURE_STALE_TTL ago are
+        returned instead and their names added to it.
+        """
+        now = time.time() if now is None else now
+        raw = raw or {}
+        binary_keys = bool(raw) and isinstance(next(iter(raw)), bytes)
+        wanted = self.names("stream", "batch", "window") if wanted is None else wanted
+        out = {}
+        for name in wanted:
+            feature = self.features[name]
+            if feature.stored:
+                stored = raw.get(feature.field if binary_keys else name)
+                value = feature.decode(stored, now)
+                if value is None and stale is not None and feature.ttl:
+                    value = feature.decode(stored, now - FEATURE_STALE_TTL)
+                    if value is not None: stale.add(name)
+                out[name] = feature.default if value is None else value
+        if any(self.features[name].source == "window" for name in wanted):
+            windows = self.velocity.summarize(raw, now)
+            out.update(self.window_values(windows, wanted))
+        return out
+
+    def window_values(self, windows, wanted=None):
+        values = {"transactions_in_last_hour": windows.get("1h", {}).get("count", 0)}
+        for label, agg in windows.items():
+            for agg_name, value in agg.items(): values[f"{agg_name}_{label}"] = value
+        return {name: value for name, value in values.items() if wanted is None or name in wanted}
+
+    def field_owner(self, field):
+        """Which feature a raw hash field belongs to (velocity slots map to 'velocity:<label>')."""
+        if field in self.features: return field
+        if field == LAST_EVENT_FIELD: return "last_transaction_amount"
+        label = field.rsplit(":", 1)[0]
+        return f"velocity:{label}" if label in self.velocity.horizons else "unknown"
+
+
+velocity = SlidingWindows(key=USER_FEATURES_KEY, ttl=USER_FEATURES_TTL)
+
+features = FeatureRegistry([
+    Feature("last_transaction_amount", float, "stream", default=0.0,
+            description="Amount of the user's latest transaction",
+            legacy_key="user:{user_id}:last_transaction_amount", derive=lambda amount, ts: amount),
+    Feature("historical_avg", float, "batch", ttl=HISTORICAL_AVG_TTL, default=None,
+            description="Average transaction amount, cached from user_historical_features",
+            legacy_key="user:{user_id}:historical_avg"),
+    Feature("transactions_in_last_hour", int, "window", default=0,
+            description="Transactions in the last hour (alias of count_1h)"),
+    *[Feature(f"{agg}_{label}", int if agg == "count" else float, "window", default=0,
+              description=f"{agg} of transaction amounts over the last {label}")
+      for label in velocity.horizons for agg in ("count", "sum", "max")],
+    Feature("total_spent", float, "offline", description="Lifetime spend (Postgres)"),
+    Feature("average_transaction_amount", float, "offline", description="Lifetime average (Postgres)"),
+], velocity)
+
+LEGACY_VELOCITY_KEY = "user:{user_id}:velocity"
+
+
+# --- Migration and memory report (CLI) ---
+
+def _scan_batches(r, pattern, batch_size):
+    batch = []
+    for key in r.scan_iter(match=pattern, count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+
+def _user_id(key, template):
+    prefix, suffix = template.split("{user_id}")
+    return key[len(prefix):len(key) - len(suffix)]
+
+
+def migrate(r, batch_size=1000, keep_old=False, dry_run=False):
+    """Fold the legacy per-feature string keys into the per-user hashes and drop stale velocity buckets.
+
+    Uses HSETNX so anything already written in the new layout wins. Legacy
+    velocity hashes are not copied: their buckets carry no width, so they
+    can't be matched to the current layout (the windows refill within their
+    horizon). Bucket fields of the per-user hashes that no longer fit the
+    layout (e.g. after VELOCITY_BUCKETS changed) are deleted. Safe to rerun.
+    """
+    now = time.time()
+    sources = [(f.legacy_key, f) for f in features.features.values() if f.legacy_key]
+    totals = {}
+    for template, feature in sources:
+        moved = 0
+        for keys in _scan_batches(r, template.format(user_id="*"), batch_size):
+            pipe = r.pipeline(transaction=False)
+            for key in keys: pipe.get(key)
+            values = pipe.execute()
+            if dry_run:
+                moved += sum(1 for v in values if v)
+                continue
+            pipe = r.pipeline(transaction=False)
+            for key, value in zip(keys, values):
+                if not value: continue
+                target = features.key(_user_id(key, template))
+                pipe.hsetnx(target, feature.name, feature.encode(value, now))
+                pipe.expire(target, features.key_ttl)
+                moved += 1
+            if not keep_old: pipe.unlink(*keys)
+            pipe.execute()
+        totals[template] = moved
+        print(f"{'🔍 Would migrate' if dry_run else '✅ Migrated'} {moved} keys from '{template}'")
+
+    dropped = 0
+    for keys in _scan_batches(r, LEGACY_VELOCITY_KEY.format(user_id="*"), batch_size):
+        dropped += len(keys)
+        if not (dry_run or keep_old): r.unlink(*keys)
+    totals[LEGACY_VELOCITY_KEY] = dropped
+    print(f"{'🔍 Would drop' if dry_run or keep_old else '✅ Dropped'} {dropped} legacy velocity hashes from '{LEGACY_VELOCITY_KEY}'")
+
+    pruned = 0
+    for keys in _scan_batches(r, USER_FEATURES_PATTERN, batch_size):
+        pipe = r.pipeline(transaction=False)
+        for key in keys: pipe.execute_command("HGETALL", key, **{NEVER_DECODE: True})
+        stale = [(key, velocity.stale_fields(raw)) for key, raw in zip(keys, pipe.execute())]
+        pruned += sum(len(fields) for _, fields in stale)
+        if dry_run: continue
+        pipe = r.pipeline(transaction=False)
+        for key, fields in stale:
+            if fields: pipe.hdel(key, *fields)
+        pipe.execute()
+    totals["stale_buckets"] = pruned
+    print(f"{'🔍 Would delete' if dry_run else '✅ Deleted'} {pruned} velocity buckets outside the current layout")
+    return totals
+
+
+def memory_report(r, sample=1000):
+    """Estimate per-feature memory from a sample of user hashes."""
+    keys = []
+    for key in r.scan_iter(match=USER_FEATURES_PATTERN, count=1000):
+        keys.append(key)
+        if len(keys) >= sample: break
+    if not keys:
+        print("No user feature hashes found.")
+        return {}
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.execute_command("HGETALL", key, **{NEVER_DECODE: True})
+        pipe.memory_usage(key, samples=0)
+        pipe.object("encoding", key)
+    results = pipe.execute()
+
+    per_feature = {}
+    total_usage = 0
+    encodings = {}
+    for i in range(0, len(results), 3):
+        raw, usage, encoding = results[i:i + 3]
+        total_usage += usage or 0
+        encodings[encoding] = encodings.get(encoding, 0) + 1
+        seen = set()
+        for field, value in raw.items():
+            owner = features.field_owner(field.decode())
+            stats = per_feature.setdefault(owner, {"bytes": 0, "users": 0, "fields": 0})
+            stats["bytes"] += len(field) + len(value)
+            stats["fields"] += 1
+            if owner not in seen:
+                stats["users"] += 1
+                seen.add(owner)
+
+    n = len(keys)
+    # Every key matching the pattern, counted cheaply with a full SCAN only when the sample was exhausted
+    total_keys = n if n < sample else sum(1 for _ in r.scan_iter(match=USER_FEATURES_PATTERN, count=5000))
+    print(f"--- Memory report: {n} of {total_keys} user hashes sampled ---")
+    print(f"Average MEMORY USAGE per user: {total_usage / n:.0f} bytes "
+          f"(~{total_usage / n * total_keys / 2**20:.1f} MiB total); encodings: {encodings}")
+    print(f"{'feature':<28}{'users %':>9}{'fields/user':>13}{'payload B/user':>16}{'est. total MiB':>16}")
+    for owner, stats in sorted(per_feature.items(), key=lambda item: -item[1]["bytes"]):
+        per_user = stats["bytes"] / n
+        print(f"{owner:<28}{stats['users'] / n * 100:>8.1f}%{stats['fields'] / n:>13.1f}{per_user:>16.1f}"
+              f"{per_user * total_keys / 2**20:>16.2f}")
+    check_encodings(r, encodings, n)
+    return per_feature
+
+
+def check_encodings(r, encodings, sampled):
+    """Compare the sampled hashes' encodings with the layout and the server's listpack limits."""
+    try:
+        limits = r.config_get("hash-max-listpack-*")
+    except Exception:
+        limits = {}  # CONFIG disabled (managed Redis): fall back to the configured value
+    max_entries = int(limits.get("hash-max-listpack-entries", HASH_MAX_LISTPACK_ENTRIES))
+    max_value = limits.get("hash-max-listpack-value", "?")
+    print(f"Layout: up to {features.max_fields} fields per user; server hash-max-listpack-entries={max_entries}, "
+          f"hash-max-listpack-value={max_value} bytes.")
+    if features.max_fields > max_entries:
+        print(f"⚠️ The layout can exceed hash-max-listpack-entries: lower VELOCITY_BUCKETS/VELOCITY_WINDOWS "
+              f"and run --migrate to drop the old buckets (or raise the server limit to at least {features.max_fields}).")
+    compact = encodings.get("listpack", 0) + encodings.get("ziplist", 0)
+    if compact < sampled:
+        print(f"⚠️ {sampled - compact} of {sampled} sampled hashes are not listpack-encoded ({encodings}).")
+    else:
+        print(f"✅ All {sampled} sampled hashes are listpack-encoded.")
+    return compact == sampled
+
+
+def list_features():
+    print(f"{'feature':<28}{'type':<7}{'source':<9}{'ttl':>8}  description")
+    for f in features.features.values():
+        print(f"{f.name:<28}{f.dtype.__name__:<7}{f.source:<9}{f.ttl if f.ttl else '-':>8}  {f.description}")
+
+
+if __name__ == "__main__":
+    import redis
+    parser = argparse.ArgumentParser(description="Feature registry: list features, migrate legacy keys, report memory.")
+    parser.add_argument("--migrate", action="store_true", help="Move legacy per-feature keys into the per-user hashes, drop stale velocity buckets")
+    parser.add_argument("--keep-old", action="store_true", help="Don't delete legacy keys after migrating")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what --migrate would move")
+    parser.add_argument("--report", action="store_true", help="Per-feature memory footprint from a sample of users")
+    parser.add_argument("--sample", type=int, default=1000)
+    args = parser.parse_args()
+
+    r = redis.Redis(host=os.getenv("REDIS_HOST", "127.0.0.1"), port=int(os.getenv("REDIS_PORT", 6379)), decode_responses=True)
+    if args.migrate: migrate(r, keep_old=args.keep_old, dry_run=args.dry_run)
+    if args.report: memory_report(r, sample=args.sample)
+    if not (args.migrate or args.report): list_features()
@@ -1,31 +1,220 @@
-import csv
-from faker import Faker
-import random
-from datetime import datetime, timedelta
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 
-fake = Faker()
+import numpy as np
 
-# A list of 500 user IDs to generate data for
-user_ids = list(range(1, 501))
-records = 10000
+# pyarrow is only needed for --format parquet
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
-print(f"Generating {records} fake transactions...")
+# --- Synthetic transactions ---
+# Rows are produced in NumPy blocks of BLOCK_ROWS. Block i draws from its own
+# generator seeded with (seed, i), so the output depends only on the seed and
+# the parameters, not on how many processes or shards produced it: the
+# shards of a run, concatenated, equal the single-file output.
+# Shards (one file each) are written in parallel, one process per shard.
+#
+# Knobs:
+#   --users / --zipf          user ids 1..N; zipf=s > 0 gives user k (by a seeded
+#                             random rank) a weight of 1/rank^s, 0 = uniform
+#   --amounts                 uniform between --amount-min/--amount-max, or lognormal
+#                             (--amount-mu/--amount-sigma) clipped to that range
+#   --fraud-bursts            bursts of --burst-size rapid, large transactions by one
+#                             user inside --burst-seconds (flagged with --labels)
+# Defaults reproduce the original file: 10,000 rows, 500 users, uniform
+# 5-500 amounts over the last year, written to transactions.csv.
 
-with open('transactions.csv', 'w', newline='') as f:
-    writer = csv.writer(f)
-    # Write the header row
-    writer.writerow(['user_id', 'amount', 'timestamp'])
+DEFAULT_ROWS = 10000
+DEFAULT_USERS = 500
+BLOCK_ROWS = int(os.getenv("GENERATE_BLOCK_ROWS", 1_000_000))
+PERMUTATION_STREAM = 0  # generator stream ids: 0 = user rank permutation, 1 = blocks
+BLOCK_STREAM = 1
 
-    for i in range(records):
-        # Pick a random user
-        user_id = random.choice(user_ids)
+_user_cdf_cache = {}
 
-        # Generate a random amount
-        amount = round(random.uniform(5.0, 500.0), 2)
 
-        # Generate a random timestamp in the last year
-        timestamp = fake.date_time_between(start_date='-1y', end_date='now')
+def user_distribution(users, zipf, seed):
+    """(cdf over ranks, rank -> user id) for Zipf sampling; cdf is None when uniform."""
+    key = (users, zipf, seed)
+    if key not in _user_cdf_cache:
+        if zipf > 0:
+            weights = np.arange(1, users + 1, dtype=np.float64) ** -zipf
+            cdf = np.cumsum(weights)
+            cdf /= cdf[-1]
+            # Hot users scattered over the id range rather than always ids 1, 2, 3...
+            ids = np.random.default_rng([seed, PERMUTATION_STREAM]).permutation(users) + 1
+        else:
+            cdf, ids = None, None
+        _user_cdf_cache[key] = (cdf, ids)
+    return _user_cdf_cache[key]
 
-        writer.writerow([user_id, amount, timestamp])
 
-print("✅ Generation complete. File 'transactions.csv' created.")
\ No newline at end of file
+def sample_users(rng, n, spec):
+    cdf, ids = user_distribution(spec["users"], spec["zipf"], spec["seed"])
+    if cdf is None: return rng.integers(1, spec["users"] + 1, n)
+    return ids[np.minimum(np.searchsorted(cdf, rng.random(n)), spec["users"] - 1)]
+
+
+def sample_amounts(rng, n, spec):
+    low, high = spec["amount_min"], spec["amount_max"]
+    if spec["amounts"] == "lognormal":
+        amounts = np.clip(rng.lognormal(spec["amount_mu"], spec["amount_sigma"], n), low, high)
+    else:
+        amounts = rng.uniform(low, high, n)
+    return np.round(amounts, 2)
+
+
+def bursts_in_block(spec, block_no):
+    """Fraud bursts assigned to this block (spread evenly; earlier blocks take the remainder)."""
+    blocks = math.ceil(spec["rows"] / spec["block_rows"])
+    base, extra = divmod(spec["fraud_bursts"], blocks)
+    return base + (block_no < extra)
+
+
+def generate_block(spec, block_no, rows):
+    """{user_id, amount, timestamp (epoch seconds), is_fraud} arrays for one block."""
+    rng = np.random.default_rng([spec["seed"], BLOCK_STREAM, block_no])
+    user_id = sample_users(rng, rows, spec)
+    amount = sample_amounts(rng, rows, spec)
+    timestamp = rng.integers(spec["start"], spec["end"], rows)
+    is_fraud = np.zeros(rows, dtype=bool)
+
+    # Bursts overwrite the tail of the block, so the row count stays exact
+    pos = rows
+    for _ in range(bursts_in_block(spec, block_no)):
+        size = min(int(rng.integers(spec["burst_size"][0], spec["burst_size"][1] + 1)), pos)
+        if size <= 0: break
+        burst = slice(pos - size, pos)
+        begin = int(rng.integers(spec["start"], max(spec["start"] + 1, spec["end"] - spec["burst_seconds"])))
+        user_id[burst] = sample_users(rng, 1, spec)[0]
+        amount[burst] = np.round(rng.uniform(0.8, 1.0, size) * spec["amount_max"], 2)
+        timestamp[burst] = begin + np.sort(rng.integers(0, spec["burst_seconds"], size))
+        is_fraud[burst] = True
+        pos -= size
+    return {"user_id": user_id, "amount": amount, "timestamp": timestamp, "is_fraud": is_fraud}
+
+
+def csv_lines(block, labels=False):
+    stamps = np.datetime_as_string(block["timestamp"].astype("datetime64[s]"), unit="s")
+    columns = [block["user_id"].tolist(), block["amount"].tolist(), stamps.tolist()]
+    if labels:
+        columns.append(block["is_fraud"].astype(np.int8).tolist())
+        return "".join(f"{u},{a:.2f},{t.replace('T', ' ')},{f}\n" for u, a, t, f in zip(*columns))
+    return "".join(f"{u},{a:.2f},{t.replace('T', ' ')}\n" for u, a, t in zip(*columns))
+
+
+def arrow_table(block, labels=False):
+    data = {"user_id": pa.array(block["user_id"].astype(np.int32)),
+            "amount": pa.array(block["amount"]),
+            "timestamp": pa.array(block["timestamp"].astype("datetime64[s]"))}
+    if labels: data["is_fraud"] = pa.array(block["is_fraud"])
+    return pa.table(data)
+
+
+def block_layout(rows, block_rows):
+    """[(block_no, rows)] covering rows."""
+    return [(i, min(block_rows, rows - i * block_rows)) for i in range(math.ceil(rows / block_rows))]
+
+
+def shard_path(output, shard_no, shards):
+    if shards == 1: return output
+    stem, ext = os.path.splitext(output)
+    return f"{stem}-{shard_no:05d}-of-{shards:05d}{ext}"
+
+
+def write_shard(spec, blocks, path):
+    """Generate and write the given blocks to one file. Returns rows written."""
+    rows = 0
+    if spec["format"] == "parquet":
+        writer = None
+        try:
+            for block_no, n in blocks:
+                table = arrow_table(generate_block(spec, block_no, n), spec["labels"])
+                if writer is None: writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+                writer.write_table(table)  # one row group per block
+                rows += n
+        finally:
+            if writer is not None: writer.close()
+        return rows
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("user_id,amount,timestamp" + (",is_fraud" if spec["labels"] else "") + "\n")
+        for block_no, n in blocks:
+            f.write(csv_lines(generate_block(spec, block_no, n), spec["labels"]))
+            rows += n
+    return rows
+
+
+def generate(rows=DEFAULT_ROWS, users=DEFAULT_USERS, output="transactions.csv", fmt="csv", seed=None,
+             shards=None, workers=None, zipf=0.0, amounts="uniform", amount_min=5.0, amount_max=500.0,
+             amount_mu=3.5, amount_sigma=1.0, days=365, end=None, fraud_bursts=0, burst_size=(8, 20),
+             burst_seconds=600, labels=False, block_rows=BLOCK_ROWS):
+    if fmt == "parquet" and pq is None: raise RuntimeError("--format parquet needs pyarrow (pip install pyarrow)")
+    if seed is not None and end is None: raise ValueError("--seed needs --end: with the default end (now) the rows move on every run")
+    seed = int(np.random.SeedSequence().entropy % 2**32) if seed is None else seed
+    # Timestamps are written as UTC, so a naive end is taken as UTC too (not local time)
+    end = end or datetime.now(timezone.utc).replace(microsecond=0)
+    end = end.replace(tzinfo=timezone.utc) if end.tzinfo is None else end.astimezone(timezone.utc)
+    workers = workers or os.cpu_count() or 1
+    blocks = block_layout(rows, block_rows)
+    shards = shards or max(1, min(workers, len(blocks)))
+    spec = {"rows": rows, "users": users, "format": fmt, "seed": seed, "zipf": zipf, "amounts": amounts,
+            "amount_min": amount_min, "amount_max": amount_max, "amount_mu": amount_mu, "amount_sigma": amount_sigma,
+            "start": int((end - timedelta(days=days)).timestamp()), "end": int(end.timestamp()),
+            "fraud_bursts": fraud_bursts, "burst_size": burst_size, "burst_seconds": burst_seconds,
+            "labels": labels, "block_rows": block_rows}
+    # Contiguous runs of blocks per shard, so shard order is row order
+    per_shard = math.ceil(len(blocks) / shards)
+    plan = [(blocks[i * per_shard:(i + 1) * per_shard], shard_path(output, i, shards)) for i in range(shards)]
+    plan = [(b, path) for b, path in plan if b]
+
+    print(f"Generating {rows:,} transactions for {users:,} users into {len(plan)} {fmt} file(s) "
+          f"(seed={seed}, end='{end.isoformat(sep=' ')}')...")
+    started = time.perf_counter()
+    if len(plan) == 1:
+        written = write_shard(spec, *plan[0])
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(plan))) as pool:
+            written = sum(pool.map(write_shard, [spec] * len(plan), *zip(*plan)))
+    elapsed = time.perf_counter() - started
+    print(f"✅ Generation complete: {written:,} rows in {elapsed:.2f}s ({written / elapsed if elapsed else 0:,.0f} rows/sec).")
+    for _, path in plan[:3]: print(f"   {path}")
+    if len(plan) > 3: print(f"   ... {len(plan) - 3} more")
+    return [path for _, path in plan]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic transactions (transactions.csv schema).")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--output", default="transactions.csv", help="File name; shards get -00000-of-0000N before the extension")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--seed", type=int, help="Same seed + parameters (incl. --end, required with --seed) = same rows")
+    parser.add_argument("--shards", type=int, help="Output files (default: one per worker for large runs)")
+    parser.add_argument("--workers", type=int, help="Processes (default: CPU count)")
+    parser.add_argument("--zipf", type=float, default=0.0, help="Hot-user skew exponent, e.g. 1.1; 0 = uniform users")
+    parser.add_argument("--amounts", choices=["uniform", "lognormal"], default="uniform")
+    parser.add_argument("--amount-min", type=float, default=5.0)
+    parser.add_argument("--amount-max", type=float, default=500.0)
+    parser.add_argument("--amount-mu", type=float, default=3.5, help="lognormal: mean of log(amount)")
+    parser.add_argument("--amount-sigma", type=float, default=1.0, help="lognormal: std of log(amount)")
+    parser.add_argument("--days", type=int, default=365, help="Timestamps span this many days before --end")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Latest timestamp, UTC unless it has an offset (default: now)")
+    parser.add_argument("--fraud-bursts", type=int, default=0, help="Number of injected fraud bursts")
+    parser.add_argument("--burst-size", type=int, nargs=2, default=(8, 20), metavar=("MIN", "MAX"))
+    parser.add_argument("--burst-seconds", type=int, default=600, help="Time span of one burst")
+    parser.add_argument("--labels", action="store_true", help="Add an is_fraud column (not loadable by batch_load.py)")
+    parser.add_argument("--block-rows", type=int, default=BLOCK_ROWS, help="Rows generated per NumPy block")
+    args = parser.parse_args()
+    try:
+        generate(args.rows, args.users, args.output, args.format, args.seed, args.shards, args.workers, args.zipf,
+                 args.amounts, args.amount_min, args.amount_max, args.amount_mu, args.amount_sigma, args.days,
+                 args.end, args.fraud_bursts, tuple(args.burst_size), args.burst_seconds, args.labels, args.block_rows)
+    except Exception as e:
+        print(f"❌ Error: {e}")
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+from collections import deque
+
+# --- Live dashboard fan-out ---
+# Every ingested transaction is appended to a capped Redis stream. One hub per
+# API worker tails that stream, builds the dashboard event ONCE (recent
+# transactions + global stats) and hands it to every connected SSE client, so
+# database load doesn't grow with the number of open dashboards.
+
+TRANSACTION_STREAM = "stream:transactions"
+STREAM_MAXLEN = int(os.getenv("LIVE_STREAM_MAXLEN", 1000))
+RECENT_SIZE = 5
+STATS_MIN_INTERVAL = float(os.getenv("LIVE_STATS_MIN_INTERVAL", 1.0))  # stats query at most this often
+CLIENT_QUEUE_SIZE = 10
+HEARTBEAT_SECONDS = 15
+
+
+def stream_entry(user_id, amount, timestamp, is_flagged):
+    """Fields to XADD for one transaction (pass maxlen=STREAM_MAXLEN, approximate=True)."""
+    return {"user_id": user_id, "amount": amount, "timestamp": timestamp.isoformat(), "is_flagged": int(bool(is_flagged))}
+
+
+def _parse_entry(fields):
+    return {"user_id": int(fields["user_id"]), "amount": float(fields["amount"]),
+            "timestamp": fields["timestamp"], "is_flagged": fields.get("is_flagged") == "1"}
+
+
+class LiveHub:
+    def __init__(self, get_redis, load_stats, stats_min_interval=STATS_MIN_INTERVAL):
+        self.get_redis = get_redis
+        self.load_stats = load_stats
+        self.stats_min_interval = stats_min_interval
+        self.recent = deque(maxlen=RECENT_SIZE)
+        self.stats = None
+        self.clients = set()
+        self._last_id = "$"
+
+    def subscribe(self):
+        queue = asyncio.Queue(CLIENT_QUEUE_SIZE)
+        self.clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.clients.discard(queue)
+
+    def snapshot(self, new_transactions=0):
+        return {"stats": self.stats, "recent_transactions": list(self.recent), "new_transactions": new_transactions}
+
+    def broadcast(self, event):
+        payload = f"event: dashboard\ndata: {json.dumps(event, default=str)}\n\n"
+        for queue in list(self.clients):
+            if queue.full():
+                # Slow client: drop its oldest event rather than block everyone else
+                queue.get_nowait()
+            queue.put_nowait(payload)
+
+    async def _seed(self, r):
+        entries = await r.xrevrange(TRANSACTION_STREAM, count=RECENT_SIZE)
+        self.recent.clear()
+        self.recent.extend(_parse_entry(fields) for _, fields in entries)
+        # Resume after the newest entry ("0-0" on an empty stream; "$" would skip entries between reads)
+        self._last_id = entries[0][0] if entries else "0-0"
+        self.stats = await self.load_stats()
+
+    async def run(self, retry_delay=1.0):
+        """Background task: tail the stream and broadcast until cancelled."""
+        loop = asyncio.get_running_loop()
+        seeded = False
+        last_stats = 0.0
+        pending = 0
+        while True:
+            r = self.get_redis()
+            if r is None:
+                await asyncio.sleep(retry_delay)
+                continue
+            try:
+                if not seeded:
+                    await self._seed(r)
+                    seeded = True
+                    last_stats = loop.time()
+                result = await r.xread({TRANSACTION_STREAM: self._last_id}, count=500, block=int(self.stats_min_interval * 1000))
+                for _, entries in result or []:
+                    for entry_id, fields in entries:
+                        self._last_id = entry_id
+                        # Newest first, like ORDER BY timestamp DESC LIMIT 5
+                        self.recent.appendleft(_parse_entry(fields))
+                        pending += 1
+                if pending and loop.time() - last_stats >= self.stats_min_interval:
+                    self.stats = await self.load_stats()
+                    last_stats = loop.time()
+                    self.broadcast(self.snapshot(pending))
+                    pending = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Live feed error: {e}")
+                seeded = False
+                await asyncio.sleep(retry_delay)
+
+    async def events(self):
+        """Async generator of SSE frames for one client."""
+        queue = self.subscribe()
+        try:
+            yield f"event: dashboard\ndata: {json.dumps(self.snapshot(), default=str)}\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(queue)
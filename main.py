@@ -1,26 +1,77 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Query, Header
 from datetime import datetime
-import redis
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
-import psycopg2
 import os
-import csv
+import numpy as np
+import json
+import base64
+import psycopg2
 from pydantic import BaseModel
+from typing import List, Optional
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from starlette.responses import HTMLResponse
+from starlette.responses import HTMLResponse, StreamingResponse, PlainTextResponse, JSONResponse
 from dotenv import load_dotenv
+from db_pool import pools
+from feature_registry import features, velocity, DUPLICATE
+from write_buffer import WriteBehindBuffer, WriteSpilled
+from csv_analytics import ColumnarCache
+from offline_store import OfflineStore
+from rollups import rollup_scheduler
+from live_feed import LiveHub, TRANSACTION_STREAM, STREAM_MAXLEN, stream_entry
+from fraud_rules import RuleEngine, RuleError
+from feature_cache import L1Cache, SingleFlight, load_with_lease, INVALIDATION_CHANNEL, invalidation_message, listen_for_invalidations
+from metrics import REGISTRY, ERRORS, MetricsMiddleware
+from serialization import respond, dumps
+from materialize import materialize_historical_avg
+from psycopg2.extras import execute_values
 
 load_dotenv()
 
 class TransactionRequest(BaseModel):
     user_id: int
     amount: float
+    durable: Optional[bool] = None  # wait for the Postgres write; None = DURABLE_WRITES
+    idempotency_key: Optional[str] = None  # or the Idempotency-Key header; retries with the same key apply once
 
 class CouponRequest(BaseModel):
     code: str
 
-app = FastAPI(title="Real-time Feature Store API")
+class ScoreTransaction(BaseModel):
+    user_id: int
+    amount: float
+
+class ScoreRequest(BaseModel):
+    transactions: List[ScoreTransaction]
+
+class BatchFeatureRequest(BaseModel):
+    user_ids: List[int]
+    features: Optional[List[str]] = None  # None = every known feature
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared Postgres/Redis pools live for the whole app, not per request
+    await pools.open()
+    if pools.redis is not None:
+        try: await features.preload(pools.redis)
+        except Exception as e: print(f"⚠️ Could not preload Redis scripts: {e}")
+    await tx_buffer.start()
+    invalidation_listener = asyncio.create_task(listen_for_invalidations(lambda: pools.redis, avg_cache))
+    rollup_refresher = asyncio.create_task(rollup_scheduler(pools.pg))
+    live_feed = asyncio.create_task(live_hub.run())
+    warmup = asyncio.create_task(warm_online_store()) if WARMUP_ON_STARTUP else None
+    if warmup is None: readiness["warm"] = True
+    yield
+    if warmup is not None: warmup.cancel()
+    invalidation_listener.cancel()
+    rollup_refresher.cancel()
+    live_feed.cancel()
+    await tx_buffer.stop()  # drain queued inserts before the pools go away
+    await pools.close()
+
+app = FastAPI(title="Real-time Feature Store API", lifespan=lifespan)
 
 origins = ["*", "null"]
 app.add_middleware(
@@ -30,33 +81,46 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "Request latency by route template", labels=("method", "route", "status"))
+app.add_middleware(MetricsMiddleware, histogram=HTTP_LATENCY)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-# Config
-REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-PG_DBNAME = os.getenv("POSTGRES_DB", "feature_store")
-PG_USER = os.getenv("POSTGRES_USER", "postgres")
-PG_PASS = os.getenv("POSTGRES_PASSWORD")
-PG_HOST = os.getenv("POSTGRES_HOST", "127.0.0.1")
-PG_PORT = os.getenv("POSTGRES_PORT", "5433")
-
-try:
-    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-    r.ping()
-    print("✅ Connected to Redis.")
-except Exception as e:
-    print(f"❌ Redis Error: {e}")
-    r = None
-
-TRANSACTIONS_1H_KEY = "user:{user_id}:transactions_in_last_hour"
-LAST_TRANSACTION_KEY = "user:{user_id}:last_transaction_amount"
-HOUR_IN_SECONDS = 3600
-
-def get_pg_conn():
-    return psycopg2.connect(dbname=PG_DBNAME, user=PG_USER, password=PG_PASS, host=PG_HOST, port=PG_PORT)
+# Per-worker L1 copy of historical_avg for the fraud check
+avg_cache = L1Cache()
+# Postgres reads of historical_avg on a miss, one per user at a time (see feature_cache.py)
+avg_loads = SingleFlight()
+HISTORICAL_AVG_LOCK_KEY = "lock:historical_avg:{key}"
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 10000))
+DURABLE_WRITES = os.getenv("DURABLE_WRITES", "false").lower() == "true"
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", 2000))
+
+# Feature names served by /features/batch (declared in feature_registry.py)
+OFFLINE_FEATURES = features.names("offline")
+ONLINE_FEATURES = features.names("stream", "batch", "window")
+HISTORICAL_AVG_DEFAULT = 50.0  # users with no history yet
+# Preload historical_avg into Redis at startup; /ready says 503 until it is done
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+WARMUP_INCREMENTAL = os.getenv("WARMUP_INCREMENTAL", "true").lower() == "true"
+readiness = {"warm": False, "warmup": None}
+
+async def warm_online_store():
+    try:
+        if pools.redis is None: raise RuntimeError("Redis unavailable")
+        stats = await materialize_historical_avg(pools.pg, pools.redis, incremental=WARMUP_INCREMENTAL)
+        readiness["warmup"] = stats
+        print(f"✅ Warm-up: {stats['rows']} users materialized, {stats['rows_per_sec']} rows/sec.")
+    except Exception as e:
+        # Still serve: misses fall back to Postgres as before
+        ERRORS.inc("warmup")
+        readiness["warmup"] = {"error": str(e)}
+        print(f"⚠️ Warm-up failed: {e}")
+    readiness["warm"] = True
+
+fraud_engine = RuleEngine.from_file()
+_unknown_rule_features = set(fraud_engine.required_features) - set(ONLINE_FEATURES + OFFLINE_FEATURES)
+if _unknown_rule_features: raise RuleError(f"Fraud rules use unknown features: {sorted(_unknown_rule_features)}")
 
 # --- Routes ---
 @app.get("/login", response_class=HTMLResponse)
@@ -86,183 +150,419 @@ async def serve_shop_profile(request: Request): return templates.TemplateRespons
 
 @app.post("/check-coupon")
 async def check_coupon(request: CouponRequest):
-    pg_conn = None
     try:
-        pg_conn = get_pg_conn()
-        cur = pg_conn.cursor()
         sql = "SELECT discount_percent FROM coupons WHERE code = %s AND is_active = TRUE"
-        cur.execute(sql, (request.code.upper(),))
-        result = cur.fetchone()
-        cur.close()
+        result = await pools.pg.fetchone(sql, (request.code.upper(),))
         if result: return {"valid": True, "discount_percent": result[0]}
         else: return {"valid": False, "message": "Invalid code."}
     except Exception as e: raise HTTPException(status_code=500, detail=f"DB Error: {e}")
-    finally:
-        if pg_conn: pg_conn.close()
 
 # --- STEP 1: INITIAL CHECK ---
 @app.post("/submit-transaction")
-async def submit_transaction(transaction: TransactionRequest):
+async def submit_transaction(transaction: TransactionRequest, idempotency_key: Optional[str] = Header(None)):
+    r = pools.redis
     if r is None: raise HTTPException(status_code=503, detail="Redis unavailable.")
     user_id = transaction.user_id
     amount = transaction.amount
     
     # Fraud Check Logic
     try:
-        current_avg_spend = r.get(f"user:{user_id}:historical_avg")
-        if current_avg_spend is None:
-            conn = get_pg_conn()
-            cur = conn.cursor()
-            cur.execute("SELECT average_transaction_amount FROM user_historical_features WHERE user_id = %s", (user_id,))
-            result = cur.fetchone()
-            current_avg_spend = float(result[0]) if result else 50.0
-            r.set(f"user:{user_id}:historical_avg", current_avg_spend)
-            cur.close()
-            conn.close()
-        else:
-            current_avg_spend = float(current_avg_spend)
-        
-        # FRAUD RULE: If suspicious, STOP and ask user
-        if amount > (current_avg_spend * 5) and amount > 300:
+        # FRAUD RULES (fraud_rules.json): only the features the rules use are fetched
+        matched = (await score_transactions([(user_id, amount)]))[0]
+        challenges = [rule for rule in matched if rule.action == "challenge"]
+        if challenges:
             # RETURN CHALLENGE - Do not save to DB yet
             return {
                 "status": "Challenge", 
-                "reason": "Unusual activity detected. Please verify your identity."
+                "reason": challenges[0].reason,
+                "rules": [rule.name for rule in challenges]
             }
             
     except Exception as e:
+        ERRORS.inc("fraud_check")
         print(f"Fraud check error: {e}")
 
     # If safe, process normally
-    return save_transaction_to_db(user_id, amount, is_flagged=False)
+    return await save_transaction_to_db(user_id, amount, is_flagged=False, durable=transaction.durable,
+                                        idempotency_key=transaction.idempotency_key or idempotency_key)
 
 # --- STEP 2: USER VERIFIED ---
 @app.post("/confirm-transaction")
-async def confirm_transaction(transaction: TransactionRequest):
+async def confirm_transaction(transaction: TransactionRequest, idempotency_key: Optional[str] = Header(None)):
     # User said "Yes", so we save it, but mark it as flagged/risky in DB
-    return save_transaction_to_db(transaction.user_id, transaction.amount, is_flagged=True)
+    return await save_transaction_to_db(transaction.user_id, transaction.amount, is_flagged=True, durable=transaction.durable,
+                                        idempotency_key=transaction.idempotency_key or idempotency_key)
+
+def insert_transactions(conn, rows):
+    # One multi-row INSERT per flush; the incremental trigger then runs once for the whole batch
+    with conn.cursor() as cur:
+        execute_values(cur, "INSERT INTO transactions_log (user_id, amount, timestamp, is_flagged) VALUES %s", rows, page_size=len(rows))
+        user_ids = list({row[0] for row in rows})
+        cur.execute("SELECT user_id, average_transaction_amount FROM user_historical_features WHERE user_id = ANY(%s)", (user_ids,))
+        return {row[0]: float(row[1]) for row in cur.fetchall() if row[1] is not None}
+
+async def flush_transactions(rows):
+    # The only step the write buffer retries: nothing here runs after the commit
+    return await pools.pg.run(insert_transactions, rows)
+
+async def after_flush_transactions(rows, new_avgs):
+    # Runs once per committed batch, best effort (a retry here would insert the rows again)
+    if pools.redis is None: return
+    pipe = pools.redis.pipeline(transaction=False)
+    # Running averages were just updated by the incremental trigger; keep the fraud-check copies fresh
+    if new_avgs:
+        for user_id, avg in new_avgs.items(): features.write(pipe, user_id, {"historical_avg": avg})
+        pipe.publish(INVALIDATION_CHANNEL, invalidation_message(new_avgs))
+    # Feed the live dashboard now that the rows are committed
+    for row in rows: pipe.xadd(TRANSACTION_STREAM, stream_entry(*row), maxlen=STREAM_MAXLEN, approximate=True)
+    await pipe.execute()
+
+def load_spilled_transaction(row):
+    user_id, amount, timestamp, is_flagged = row
+    return user_id, amount, datetime.fromisoformat(timestamp), is_flagged
+
+tx_buffer = WriteBehindBuffer(flush_transactions, after_flush_transactions, load_row=load_spilled_transaction)
 
 # Helper function to save to DB/Redis
-def save_transaction_to_db(user_id, amount, is_flagged):
-    pg_conn = None
+async def save_transaction_to_db(user_id, amount, is_flagged, durable=None, idempotency_key=None):
     try:
-        pg_conn = get_pg_conn()
-        pg_conn.autocommit = True
-        cur = pg_conn.cursor()
-        sql = "INSERT INTO transactions_log (user_id, amount, timestamp, is_flagged) VALUES (%s, %s, %s, %s)"
-        cur.execute(sql, (user_id, amount, datetime.now(), is_flagged))
-        
-        pipe = r.pipeline()
-        pipe.set(LAST_TRANSACTION_KEY.format(user_id=user_id), amount)
-        tx_1h_key = TRANSACTIONS_1H_KEY.format(user_id=user_id)
-        pipe.incr(tx_1h_key)
-        pipe.expire(tx_1h_key, HOUR_IN_SECONDS)
-        pipe.execute()
+        timestamp = datetime.now()
+        # Every online feature in one atomic EVALSHA; a retry with the same key changes nothing
+        status, = await features.apply_transactions(pools.redis, [(user_id, amount, timestamp.timestamp(), idempotency_key)])
+        if status == DUPLICATE: return {"status": "Approved", "reason": "Duplicate request ignored.", "duplicate": True}
+
+        # Postgres write is batched in the background unless the caller asked to wait for it
+        try: await tx_buffer.put((user_id, amount, timestamp, is_flagged), durable=DURABLE_WRITES if durable is None else durable)
+        except WriteSpilled:
+            # On local disk and replayed on the next start: stored as far as a retry is concerned
+            return {"status": "Approved", "reason": "Order confirmed; storage delayed.", "deferred": True}
+        except Exception:
+            # Not stored: the features are applied, so a retry with this key only stores the row
+            if idempotency_key: await features.mark_unstored(pools.redis, idempotency_key)
+            raise
         
         return {"status": "Approved", "reason": "Order confirmed."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    finally:
-        if pg_conn: pg_conn.close()
 
 # (Keep all GET endpoints for stats, features, etc. exactly the same as before)
 @app.get("/stats/global")
-def get_global_stats():
-    pg_conn = None
+async def get_global_stats():
     try:
-        pg_conn = get_pg_conn()
-        cur = pg_conn.cursor()
-        cur.execute("SELECT COUNT(*), SUM(amount) FROM transactions_log")
-        stats = cur.fetchone()
-        cur.execute("SELECT COUNT(*) FROM user_historical_features")
-        user_count = cur.fetchone()
-        return {"total_transactions": stats[0] or 0, "total_volume": stats[1] or 0, "total_users": user_count[0] or 0}
+        # Maintained counters via the stored procedure: constant time regardless of table size
+        stats = await pools.pg.fetchone("SELECT total_tx, total_vol, total_users FROM get_dashboard_metrics()")
+        return {"total_transactions": stats[0] or 0, "total_volume": stats[1] or 0, "total_users": stats[2] or 0}
+    except (psycopg2.errors.UndefinedTable, psycopg2.errors.UndefinedFunction):
+        # Counters not set up yet: fall back to scanning
+        try:
+            stats = await pools.pg.fetchone("SELECT COUNT(*), SUM(amount) FROM transactions_log")
+            user_count = await pools.pg.fetchone("SELECT COUNT(*) FROM user_historical_features")
+            return {"total_transactions": stats[0] or 0, "total_volume": stats[1] or 0, "total_users": user_count[0] or 0}
+        except Exception: return {"total_transactions": 0, "total_volume": 0, "total_users": 0}
     except Exception: return {"total_transactions": 0, "total_volume": 0, "total_users": 0}
-    finally:
-        if pg_conn: pg_conn.close()
+
+live_hub = LiveHub(lambda: pools.redis, get_global_stats)
+
+@app.get("/stream/dashboard")
+async def stream_dashboard():
+    # Server-Sent Events: stats + recent transactions pushed from the shared hub
+    return StreamingResponse(live_hub.events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/transactions/recent/global")
-def get_global_recent_transactions():
-    pg_conn = None
+async def get_global_recent_transactions():
     try:
-        pg_conn = get_pg_conn()
-        cur = pg_conn.cursor()
-        sql = "SELECT user_id, amount, timestamp, is_flagged FROM transactions_log ORDER BY timestamp DESC LIMIT 5"
-        cur.execute(sql)
-        transactions = cur.fetchall()
+        sql = "SELECT user_id, amount, timestamp, is_flagged FROM transactions_log {where} ORDER BY timestamp DESC LIMIT 5"
+        # Bounded first so a partitioned log only touches the newest partitions; full scan only if that comes up short
+        transactions = await pools.pg.fetchall(sql.format(where="WHERE timestamp >= now() - interval '31 days'"))
+        if len(transactions) < 5: transactions = await pools.pg.fetchall(sql.format(where=""))
         return {"recent_transactions": [{"user_id": row[0], "amount": row[1], "timestamp": row[2], "is_flagged": row[3]} for row in transactions]}
     except Exception: return {"recent_transactions": []}
-    finally:
-        if pg_conn: pg_conn.close()
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {"historical_avg": avg_cache.stats()}
+
+# Scrape-time gauges and counters: read state that is already tracked, nothing extra on the request path
+REGISTRY.callback_counter("feature_cache_requests_total", "historical_avg L1 lookups by result", lambda: {("hit",): avg_cache.hits, ("miss",): avg_cache.misses}, labels=("result",))
+REGISTRY.gauge("feature_cache_hit_ratio", "historical_avg L1 hit ratio", lambda: avg_cache.stats()["hit_ratio"])
+REGISTRY.gauge("feature_loads_in_flight", "historical_avg Postgres loads this worker is running or waiting on", lambda: len(avg_loads))
+REGISTRY.gauge("write_buffer_depth", "Transactions queued for the next group commit", lambda: tx_buffer.depth)
+REGISTRY.gauge("live_feed_clients", "Connected dashboard SSE clients", lambda: len(live_hub.clients))
+
+@app.get("/ready")
+async def get_ready():
+    # For load balancers: only take traffic once Redis is up and the warm-up has run
+    ready = readiness["warm"] and pools.redis is not None
+    body = {"ready": ready, "warmup": readiness["warmup"]}
+    return body if ready else JSONResponse(body, status_code=503)
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/features/{user_id}")
-def get_real_time_features(user_id: int):
-    if r is None: return {}
+async def get_real_time_features(user_id: int, request: Request):
+    r = pools.redis
+    if r is None: return respond(request, {})
     try:
-        pipe = r.pipeline()
-        pipe.get(LAST_TRANSACTION_KEY.format(user_id=user_id))
-        pipe.get(TRANSACTIONS_1H_KEY.format(user_id=user_id))
-        results = pipe.execute()
-        return {"user_id": user_id, "retrieved_at": datetime.now(), "real_time_features": {"last_transaction_amount": float(results[0]) if results[0] else 0.0, "transactions_in_last_hour": int(results[1]) if results[1] else 0}}
-    except Exception: return {}
+        raw = await features.fetch(r, user_id)
+        windows = velocity.summarize(raw)
+        last = features.read(raw, ["last_transaction_amount"])["last_transaction_amount"]
+        return respond(request, {"user_id": user_id, "retrieved_at": datetime.now(), "real_time_features": {"last_transaction_amount": last, "transactions_in_last_hour": windows.get("1h", {}).get("count", 0), "windows": windows}})
+    except Exception: return respond(request, {})
+
+async def load_historical_avgs(user_ids, wait=True):
+    """Postgres -> Redis (and L1) for historical_avg, one loader per user across all workers."""
+    async def from_postgres(ids):
+        rows = await pools.pg.fetchall("SELECT user_id, average_transaction_amount FROM user_historical_features WHERE user_id = ANY(%s)", (ids,))
+        found = {row[0]: float(row[1]) for row in rows}
+        avgs = {user_id: found.get(user_id, HISTORICAL_AVG_DEFAULT) for user_id in ids}
+        pipe = pools.redis.pipeline(transaction=False)
+        for user_id, avg in avgs.items(): features.write(pipe, user_id, {"historical_avg": avg})
+        await pipe.execute()
+        return avgs
+
+    async def from_redis(ids):
+        pipe = pools.redis.pipeline(transaction=False)
+        for user_id in ids: features.fetch(pipe, user_id, ["historical_avg"])
+        avgs = {user_id: features.read({"historical_avg": raw[0]}, ["historical_avg"])["historical_avg"]
+                for user_id, raw in zip(ids, await pipe.execute())}
+        return {user_id: avg for user_id, avg in avgs.items() if avg is not None}
+
+    avgs = await load_with_lease(pools.redis, user_ids, from_postgres, from_redis, wait=wait, lock_key=HISTORICAL_AVG_LOCK_KEY)
+    for user_id, avg in avgs.items(): avg_cache.set(user_id, avg)
+    return avgs
+
+async def fetch_feature_vectors(user_ids, wanted):
+    """{user_id: {feature: value}} for just the wanted features.
+
+    Costs at most one Redis pipeline (one HMGET/HGETALL per user) and one
+    Postgres query, however many users or features are asked for.
+    historical_avg goes L1 -> Redis -> Postgres; concurrent Postgres loads of
+    the same user are coalesced, and a recently expired value is served while
+    it is reloaded in the background.
+    """
+    vectors = {user_id: {} for user_id in user_ids}
+    online_wanted = [f for f in wanted if f in ONLINE_FEATURES and f != "historical_avg"]
+    need_windows = any(features[f].source == "window" for f in online_wanted)
+    avg_misses = []
+    if "historical_avg" in wanted:
+        for user_id in user_ids:
+            avg = avg_cache.get(user_id)
+            if avg is None: avg_misses.append(user_id)
+            else: vectors[user_id]["historical_avg"] = avg
+
+    pg_avg_misses = []
+    if (online_wanted or avg_misses) and user_ids:
+        r = pools.redis
+        if r is None: raise HTTPException(status_code=503, detail="Redis unavailable.")
+        avg_miss_set = set(avg_misses)
+        pipe = r.pipeline(transaction=False)
+        reads = []
+        for user_id in user_ids:
+            fields = online_wanted + (["historical_avg"] if user_id in avg_miss_set else [])
+            if not fields: continue
+            # Velocity buckets need the whole hash; scalar features just their fields
+            features.fetch(pipe, user_id, None if need_windows else fields)
+            reads.append((user_id, fields))
+        stale_avgs = []
+        for (user_id, fields), raw in zip(reads, await pipe.execute()):
+            if not need_windows: raw = dict(zip(fields, raw))
+            stale = set()
+            online = features.read(raw, fields, stale=stale)
+            if user_id in avg_miss_set:
+                avg = online.pop("historical_avg")
+                if avg is None: pg_avg_misses.append(user_id)
+                else:
+                    vectors[user_id]["historical_avg"] = avg
+                    if stale: stale_avgs.append(user_id)
+                    else: avg_cache.set(user_id, avg)
+            vectors[user_id].update(online)
+        # Stale-while-revalidate: answer now, one worker reloads in the background
+        if stale_avgs: avg_loads.refresh(stale_avgs, lambda ids: load_historical_avgs(ids, wait=False))
+
+    offline_wanted = [f for f in OFFLINE_FEATURES if f in wanted]
+    if offline_wanted and user_ids:
+        # Postgres is queried anyway, so it answers the historical_avg misses too
+        rows = await pools.pg.fetchall("SELECT user_id, total_spent, average_transaction_amount FROM user_historical_features WHERE user_id = ANY(%s)", (user_ids,))
+        found = {row[0]: {"total_spent": float(row[1]), "average_transaction_amount": float(row[2])} for row in rows}
+        for user_id in user_ids:
+            offline = found.get(user_id)
+            vectors[user_id].update({f: offline[f] if offline else None for f in offline_wanted})
+        if pg_avg_misses:
+            pipe = pools.redis.pipeline(transaction=False)
+            for user_id in pg_avg_misses:
+                offline = found.get(user_id)
+                avg = offline["average_transaction_amount"] if offline else HISTORICAL_AVG_DEFAULT
+                vectors[user_id]["historical_avg"] = avg
+                avg_cache.set(user_id, avg)
+                features.write(pipe, user_id, {"historical_avg": avg})
+            await pipe.execute()
+    elif pg_avg_misses:
+        avgs = await avg_loads.load_many(pg_avg_misses, load_historical_avgs)
+        for user_id in pg_avg_misses: vectors[user_id]["historical_avg"] = avgs[user_id]
+    return vectors
+
+@app.post("/features/batch")
+async def get_batch_features(batch: BatchFeatureRequest, request: Request):
+    # One Redis pipeline + one Postgres query for the whole batch
+    wanted = batch.features or ONLINE_FEATURES + OFFLINE_FEATURES
+    unknown = [f for f in wanted if f not in ONLINE_FEATURES and f not in OFFLINE_FEATURES]
+    if unknown: raise HTTPException(status_code=400, detail=f"Unknown features: {unknown}")
+    user_ids = list(dict.fromkeys(batch.user_ids))
+    if len(user_ids) > MAX_BATCH_SIZE: raise HTTPException(status_code=400, detail=f"Batch larger than {MAX_BATCH_SIZE} users.")
+    try: vectors = await fetch_feature_vectors(user_ids, wanted)
+    except HTTPException: raise
+    except Exception as e: raise HTTPException(status_code=500, detail=f"DB Error: {e}")
+    return respond(request, {"features": wanted, "results": [{"user_id": user_id, "features": vectors[user_id]} for user_id in user_ids]})
+
+async def score_transactions(transactions):
+    """Run the fraud rules over [(user_id, amount), ...]. Fetches each user's features once."""
+    required = fraud_engine.required_features
+    vectors = await fetch_feature_vectors(list(dict.fromkeys(u for u, _ in transactions)), required) if required else {}
+    columns = {f: [vectors[u].get(f) for u, _ in transactions] for f in required}
+    return fraud_engine.score([amount for _, amount in transactions], columns)
+
+@app.post("/fraud/score")
+async def score_batch(request: ScoreRequest):
+    if len(request.transactions) > MAX_BATCH_SIZE: raise HTTPException(status_code=400, detail=f"Batch larger than {MAX_BATCH_SIZE} transactions.")
+    txs = [(t.user_id, t.amount) for t in request.transactions]
+    try: matched = await score_transactions(txs)
+    except HTTPException: raise
+    except Exception as e: raise HTTPException(status_code=500, detail=f"Scoring error: {e}")
+    return {"results": [
+        {"user_id": user_id, "amount": amount, "status": "Challenge" if any(r.action == "challenge" for r in rules) else "Approved", "rules": [r.name for r in rules]}
+        for (user_id, amount), rules in zip(txs, matched)
+    ]}
+
+@app.get("/fraud/rules")
+async def get_fraud_rules():
+    return {"required_features": fraud_engine.required_features, "rules": fraud_engine.stats()}
 
 @app.get("/features/historical/{user_id}")
-def get_historical_features(user_id: int):
-    pg_conn = None
+async def get_historical_features(user_id: int, request: Request):
     res = None
     try:
-        pg_conn = get_pg_conn()
-        cur = pg_conn.cursor()
-        cur.execute("SELECT total_spent, average_transaction_amount FROM user_historical_features WHERE user_id = %s", (user_id,))
-        res = cur.fetchone()
-        cur.close()
+        res = await pools.pg.fetchone("SELECT total_spent, average_transaction_amount FROM user_historical_features WHERE user_id = %s", (user_id,))
     except Exception: pass
-    finally:
-        if pg_conn: pg_conn.close()
-    if res: return {"user_id": user_id, "historical_features": {"total_spent": res[0], "average_transaction_amount": res[1]}}
+    if res: return respond(request, {"user_id": user_id, "historical_features": {"total_spent": res[0], "average_transaction_amount": res[1]}})
     else: raise HTTPException(status_code=404)
 
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps({"ts": timestamp.isoformat(), "id": row_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return datetime.fromisoformat(raw["ts"]), int(raw["id"])
+    except Exception: raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+async def stream_user_transactions(user_id):
+    # Server-side (named) cursor: rows come over in chunks, never all at once
+    async with pools.pg.connection() as conn:
+        cur = conn.cursor(name=f"tx_stream_{user_id}")
+        cur.itersize = STREAM_CHUNK_ROWS
+        try:
+            await pools.pg.call(conn, cur.execute, "SELECT amount, timestamp FROM transactions_log WHERE user_id = %s ORDER BY timestamp DESC, id DESC", (user_id,))
+            while True:
+                rows = await pools.pg.call(conn, cur.fetchmany, STREAM_CHUNK_ROWS)
+                if not rows: break
+                yield b"".join(dumps({"amount": float(row[0]), "timestamp": row[1]}) + b"\n" for row in rows)
+        finally:
+            await pools.pg.call(conn, cur.close)
+
 @app.get("/transactions/all/{user_id}")
-def get_all_transactions(user_id: int):
-    pg_conn = None
+async def get_all_transactions(user_id: int, limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None, format: str = "json"):
+    if format == "ndjson":
+        return StreamingResponse(stream_user_transactions(user_id), media_type="application/x-ndjson")
+    # Keyset pagination on (user_id, timestamp DESC, id DESC): id breaks timestamp ties, so every
+    # page is one index range scan that starts right after the last row sent (no OFFSET)
     try:
-        pg_conn = get_pg_conn()
-        cur = pg_conn.cursor()
-        cur.execute("SELECT amount, timestamp FROM transactions_log WHERE user_id = %s ORDER BY timestamp DESC", (user_id,))
-        res = cur.fetchall()
-        return {"user_id": user_id, "transactions": [{"amount": row[0], "timestamp": row[1]} for row in res]}
+        if cursor:
+            last_ts, last_id = decode_cursor(cursor)
+            res = await pools.pg.fetchall("SELECT amount, timestamp, id FROM transactions_log WHERE user_id = %s AND (timestamp, id) < (%s, %s) ORDER BY timestamp DESC, id DESC LIMIT %s", (user_id, last_ts, last_id, limit))
+        else:
+            res = await pools.pg.fetchall("SELECT amount, timestamp, id FROM transactions_log WHERE user_id = %s ORDER BY timestamp DESC, id DESC LIMIT %s", (user_id, limit))
+    except HTTPException: raise
     except Exception: return {"transactions": []}
-    finally:
-        if pg_conn: pg_conn.close()
+    next_cursor = encode_cursor(res[-1][1], res[-1][2]) if len(res) == limit else None
+    return {"user_id": user_id, "transactions": [{"amount": row[0], "timestamp": row[1]} for row in res], "next_cursor": next_cursor}
 
 @app.get("/analytics/all")
-def get_all_analytics():
-    pg_conn = None
+async def get_all_analytics(request: Request):
+    # Reads the incrementally maintained rollups (setup_rollups.py), not the raw log
     try:
-        pg_conn = get_pg_conn()
-        cur = pg_conn.cursor()
-        cur.execute("SELECT date_trunc('day', timestamp) AS sales_day, SUM(amount) AS total_sales FROM transactions_log GROUP BY sales_day ORDER BY sales_day;")
-        sales = cur.fetchall()
-        cur.execute("SELECT user_id, SUM(amount) AS total_spent FROM transactions_log GROUP BY user_id ORDER BY total_spent DESC LIMIT 10;")
-        spenders = cur.fetchall()
-        return {"sales_over_time": [{"day": row[0], "sales": row[1]} for row in sales], "top_spenders": [{"user_id": row[0], "total": row[1]} for row in spenders]}
-    except Exception: return {"sales_over_time": [], "top_spenders": []}
-    finally:
-        if pg_conn: pg_conn.close()
+        sales = await pools.pg.fetchall("SELECT sales_day, total_sales FROM sales_daily ORDER BY sales_day;")
+        spenders = await pools.pg.fetchall("SELECT user_id, total_spent FROM user_spend_totals ORDER BY total_spent DESC LIMIT 10;")
+    except psycopg2.errors.UndefinedTable:
+        # Rollups not set up yet: aggregate the Parquet export if there is one (as fresh as its last export)
+        if offline.available():
+            cols = await asyncio.to_thread(offline.transaction_columns)
+            keep = np.ones(len(cols), dtype=bool)
+            return respond(request, {"sales_over_time": [{"day": d["day"], "sales": d["sales"]} for d in cols.daily_totals(keep)],
+                                     "top_spenders": [{"user_id": u["user_id"], "total": u["total"]} for u in cols.user_totals(keep, 10)]})
+        # Otherwise scan the log
+        try:
+            sales = await pools.pg.fetchall("SELECT date_trunc('day', timestamp) AS sales_day, SUM(amount) AS total_sales FROM transactions_log GROUP BY sales_day ORDER BY sales_day;")
+            spenders = await pools.pg.fetchall("SELECT user_id, SUM(amount) AS total_spent FROM transactions_log GROUP BY user_id ORDER BY total_spent DESC LIMIT 10;")
+        except Exception: return respond(request, {"sales_over_time": [], "top_spenders": []})
+    except Exception: return respond(request, {"sales_over_time": [], "top_spenders": []})
+    return respond(request, {"sales_over_time": [{"day": row[0], "sales": row[1]} for row in sales], "top_spenders": [{"user_id": row[0], "total": row[1]} for row in spenders]})
+
+@app.get("/analytics/hourly")
+async def get_hourly_analytics(request: Request, hours: int = Query(48, ge=1, le=24 * 90)):
+    try:
+        sales = await pools.pg.fetchall("SELECT sales_hour, total_sales, tx_count FROM sales_hourly WHERE sales_hour >= date_trunc('hour', now()) - make_interval(hours => %s) ORDER BY sales_hour;", (hours,))
+        return respond(request, {"sales_over_time": [{"hour": row[0], "sales": row[1], "tx_count": row[2]} for row in sales]})
+    except Exception: return respond(request, {"sales_over_time": []})
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+csv_cache = ColumnarCache(os.path.join(BASE_DIR, "transactions.csv"))
+
+def load_csv_columns():
+    try: return csv_cache.get()
+    except OSError: raise HTTPException(status_code=404)
+
+# Parquet export of the offline store (offline_store.py); ?source=parquet on the analytics routes
+offline = OfflineStore()
+
+def load_columns(source, user_id=None, start=None, end=None, min_amount=None, max_amount=None):
+    if source == "csv": return load_csv_columns()
+    if source != "parquet": raise HTTPException(status_code=400, detail="source must be 'csv' or 'parquet'")
+    # Filters are pushed down into the scan, so only matching row groups are decoded
+    try: return offline.transaction_columns(user_id, start, end, min_amount, max_amount)
+    except (FileNotFoundError, RuntimeError) as e: raise HTTPException(status_code=404, detail=str(e))
 
 @app.get("/analytics/from-csv")
-def get_csv_analytics():
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    CSV_FILE_PATH = os.path.join(BASE_DIR, "transactions.csv")
-    data = []
+def get_csv_analytics(request: Request, offset: int = 0, limit: int = Query(1000, ge=1, le=100000), format: str = "json",
+                      user_id: Optional[int] = None, start: Optional[str] = None, end: Optional[str] = None,
+                      min_amount: Optional[float] = None, max_amount: Optional[float] = None, source: str = "csv"):
+    try:
+        cols = load_columns(source, user_id, start, end, min_amount, max_amount)
+        index = np.flatnonzero(cols.mask(user_id, start, end, min_amount, max_amount))
+    except ValueError as e: raise HTTPException(status_code=400, detail=f"Bad filter: {e}")
+    if format == "ndjson":
+        # Every matching row, streamed in chunks instead of one big JSON blob
+        return StreamingResponse(cols.iter_ndjson(index), media_type="application/x-ndjson")
+    page = index[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(index) else None
+    return respond(request, {"total_rows": int(len(index)), "offset": offset, "next_offset": next_offset, "data": cols.rows(page)})
+
+@app.get("/analytics/from-csv/daily")
+def get_csv_daily_totals(request: Request, user_id: Optional[int] = None, start: Optional[str] = None, end: Optional[str] = None,
+                         min_amount: Optional[float] = None, max_amount: Optional[float] = None, source: str = "csv"):
+    try:
+        cols = load_columns(source, user_id, start, end, min_amount, max_amount)
+        keep = cols.mask(user_id, start, end, min_amount, max_amount)
+    except ValueError as e: raise HTTPException(status_code=400, detail=f"Bad filter: {e}")
+    return respond(request, {"sales_over_time": cols.daily_totals(keep)})
+
+@app.get("/analytics/from-csv/users")
+def get_csv_user_totals(request: Request, top: Optional[int] = 10, start: Optional[str] = None, end: Optional[str] = None,
+                        min_amount: Optional[float] = None, max_amount: Optional[float] = None, source: str = "csv"):
     try:
-        with open(CSV_FILE_PATH, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    row['user_id'] = int(row['user_id'])
-                    row['amount'] = float(row['amount'])
-                except ValueError: continue
-                data.append(row)
-        return {"total_rows": len(data), "data": data}
-    except Exception: raise HTTPException(status_code=404)
\ No newline at end of file
+        cols = load_columns(source, None, start, end, min_amount, max_amount)
+        keep = cols.mask(None, start, end, min_amount, max_amount)
+    except ValueError as e: raise HTTPException(status_code=400, detail=f"Bad filter: {e}")
+    return respond(request, {"top_spenders": cols.user_totals(keep, top)})
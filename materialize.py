@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from db_pool import Pools
+from feature_cache import INVALIDATION_CHANNEL, invalidation_message
+from feature_registry import features
+
+load_dotenv()
+
+# --- Bulk materialization of historical_avg into Redis ---
+# The API only fills historical_avg lazily on a Redis miss, so after a Redis
+# restart or a batch reload every user's first request goes to Postgres at
+# once. This job pushes the whole offline table (or just the rows changed
+# since the last run) into the online store up front:
+#   Postgres named cursor -> chunks of MATERIALIZE_CHUNK_ROWS -> queue ->
+#   MATERIALIZE_WORKERS writers, one non-transactional pipeline per chunk.
+# The queue is bounded, so a slow Redis throttles the reader instead of
+# buffering the table in memory. Incremental runs invalidate the API's L1
+# cache for the users in each chunk (published in the chunk's pipeline);
+# only a full run drops the whole cache.
+
+MATERIALIZE_CHUNK_ROWS = int(os.getenv("MATERIALIZE_CHUNK_ROWS", 5000))
+MATERIALIZE_WORKERS = int(os.getenv("MATERIALIZE_WORKERS", 4))
+# Re-read this much before the previous run's start: rows committed late by
+# an older transaction carry a last_updated slightly before it
+MATERIALIZE_WATERMARK_OVERLAP = float(os.getenv("MATERIALIZE_WATERMARK_OVERLAP", 60))
+WATERMARK_KEY = "materialize:historical_avg:watermark"
+
+SELECT_SQL = "SELECT user_id, average_transaction_amount FROM user_historical_features"
+
+
+def _has_last_updated(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name = 'user_historical_features' AND column_name = 'last_updated')
+        """)
+        return cur.fetchone()[0]
+
+
+async def materialize_historical_avg(pg, r, workers=MATERIALIZE_WORKERS, chunk_rows=MATERIALIZE_CHUNK_ROWS,
+                                     incremental=False):
+    """Copy user_historical_features.average_transaction_amount into each user's feature hash.
+
+    pg is a db_pool.PgPool, r an async Redis client. With incremental=True
+    only rows whose last_updated is past the stored watermark are copied
+    (a full run if there is none yet). Returns {"rows", "chunks", "seconds",
+    "rows_per_sec", "incremental"}.
+    """
+    started = time.perf_counter()
+    since = await r.get(WATERMARK_KEY) if incremental else None
+    queue = asyncio.Queue(maxsize=workers * 2)
+    stats = {"rows": 0, "chunks": 0, "incremental": False}
+    errors = []
+
+    async def writer():
+        while True:
+            chunk = await queue.get()
+            if chunk is None: return
+            if errors: continue  # keep draining so the reader never blocks on a full queue
+            try:
+                now = time.time()
+                pipe = r.pipeline(transaction=False)
+                for user_id, avg in chunk: features.write(pipe, user_id, {"historical_avg": float(avg)}, now)
+                if stats["incremental"]:
+                    pipe.publish(INVALIDATION_CHANNEL, invalidation_message([user_id for user_id, _ in chunk]))
+                await pipe.execute()
+                stats["rows"] += len(chunk)
+                stats["chunks"] += 1
+            except Exception as e:
+                errors.append(e)
+
+    tasks = [asyncio.create_task(writer()) for _ in range(workers)]
+    try:
+        async with pg.connection() as conn:
+            def start():
+                incremental_ok = since is not None and _has_last_updated(conn)
+                with conn.cursor() as cur:
+                    cur.execute("SELECT now()::timestamp")
+                    db_now = cur.fetchone()[0]
+                # Server-side cursor: Postgres streams the rows, chunk_rows at a time
+                cur = conn.cursor(name="materialize_historical_avg")
+                cur.itersize = chunk_rows
+                if incremental_ok: cur.execute(f"{SELECT_SQL} WHERE last_updated >= %s OR last_updated IS NULL", (datetime.fromisoformat(since),))
+                else: cur.execute(SELECT_SQL)
+                return cur, db_now, incremental_ok
+
+            cur, db_now, stats["incremental"] = await pg.call(conn, start)
+            try:
+                while not errors:
+                    chunk = await pg.call(conn, cur.fetchmany, chunk_rows)
+                    if not chunk: break
+                    await queue.put(chunk)
+            finally:
+                await pg.call(conn, cur.close)
+                await pg.call(conn, conn.rollback)
+    finally:
+        for _ in tasks: await queue.put(None)
+        await asyncio.gather(*tasks)
+    if errors: raise errors[0]
+
+    await r.set(WATERMARK_KEY, (db_now - timedelta(seconds=MATERIALIZE_WATERMARK_OVERLAP)).isoformat())
+    if stats["rows"] and not stats["incremental"]: await r.publish(INVALIDATION_CHANNEL, invalidation_message())
+    seconds = time.perf_counter() - started
+    return {**stats, "seconds": round(seconds, 3), "rows_per_sec": round(stats["rows"] / seconds, 1) if seconds else 0.0}
+
+
+async def run(workers=MATERIALIZE_WORKERS, chunk_rows=MATERIALIZE_CHUNK_ROWS, incremental=False):
+    pools = Pools()
+    await pools.open()
+    try:
+        if pools.redis is None: raise RuntimeError("Redis unavailable")
+        return await materialize_historical_avg(pools.pg, pools.redis, workers, chunk_rows, incremental)
+    finally:
+        await pools.close()
+
+
+def materialize(workers=MATERIALIZE_WORKERS, chunk_rows=MATERIALIZE_CHUNK_ROWS, incremental=False):
+    try:
+        print("--- Materializing historical_avg into Redis ---")
+        stats = asyncio.run(run(workers, chunk_rows, incremental))
+        mode = "incremental" if stats["incremental"] else "full"
+        print(f"✅ {stats['rows']} users in {stats['chunks']} chunks ({mode}), "
+              f"{stats['seconds']}s, {stats['rows_per_sec']} rows/sec.")
+        return stats
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load historical_avg for every user from Postgres into Redis.")
+    parser.add_argument("--incremental", action="store_true", help="Only users changed since the last run")
+    parser.add_argument("--workers", type=int, default=MATERIALIZE_WORKERS, help="Parallel Redis writers")
+    parser.add_argument("--chunk-rows", type=int, default=MATERIALIZE_CHUNK_ROWS, help="Rows per fetch and per pipeline")
+    args = parser.parse_args()
+    materialize(args.workers, args.chunk_rows, args.incremental)
@@ -0,0 +1,153 @@
+import time
+from bisect import bisect_left
+
+# --- Lightweight metrics in Prometheus text format ---
+# Recording is a dict lookup plus a bisect, with no locks and no allocation
+# on the hot path (the API runs on one event loop per worker). Values that
+# already live somewhere else (queue depth, cache hit counts) are read by
+# callback gauges, or callback counters for ever-increasing totals, only
+# when /metrics is scraped.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names: return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names + ('le',), labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram, self.labels = histogram, labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Gauge:
+    """Value computed at scrape time by fn() -> number or {label tuple: number}."""
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name, self.help, self.fn, self.label_names = name, help, fn, tuple(labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            value = self.fn()
+        except Exception:
+            return lines
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, v in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {v}")
+        return lines
+
+
+class CallbackCounter(Gauge):
+    """Monotonic total read at scrape time (e.g. hits kept by a cache); name should end in _total."""
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs): return self.register(Counter(*args, **kwargs))
+    def histogram(self, *args, **kwargs): return self.register(Histogram(*args, **kwargs))
+    def gauge(self, *args, **kwargs): return self.register(Gauge(*args, **kwargs))
+    def callback_counter(self, *args, **kwargs): return self.register(CallbackCounter(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Store-level metrics, recorded by db_pool.py
+REDIS_COMMAND_SECONDS = REGISTRY.histogram("redis_command_duration_seconds", "Redis round trip time by command (PIPELINE for pipelines)", labels=("command",))
+PG_QUERY_SECONDS = REGISTRY.histogram("postgres_query_duration_seconds", "Postgres call time by operation, excluding connection acquire", labels=("operation",))
+PG_ACQUIRE_SECONDS = REGISTRY.histogram("postgres_pool_acquire_seconds", "Time spent waiting for a pooled Postgres connection")
+REDIS_ACQUIRE_SECONDS = REGISTRY.histogram("redis_pool_acquire_seconds", "Time spent waiting for a pooled Redis connection")
+ERRORS = REGISTRY.counter("app_errors_total", "Errors caught and handled instead of failing the request", labels=("where",))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route latency histogram labelled by the route template."""
+
+    def __init__(self, app, histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start": status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            self.histogram.observe(time.perf_counter() - started, scope["method"], path, status[0])
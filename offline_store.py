@@ -0,0 +1,265 @@
+import argparse
+import glob
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from csv_analytics import TransactionColumns
+
+# pyarrow is optional: without it the store simply reports itself unavailable
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None
+
+load_dotenv()
+
+# DB Config
+PG_DBNAME = os.getenv("POSTGRES_DB", "feature_store")
+PG_USER = os.getenv("POSTGRES_USER", "postgres")
+PG_PASS = os.getenv("POSTGRES_PASSWORD", "Sanvi@123")
+PG_HOST = os.getenv("POSTGRES_HOST", "127.0.0.1")
+PG_PORT = os.getenv("POSTGRES_PORT", "5433")
+
+# --- Columnar (Parquet) copy of the offline store ---
+# Layout under OFFLINE_STORE_DIR (hive-style directories):
+#   transactions/date=2025-01-31/part-<export>-<n>.parquet   appended by id watermark
+#   user_features/bucket=7/part-<export>-<n>.parquet        full snapshot, user-hash buckets
+#   _state.json                                              committed exports + watermark
+# An export only becomes visible when _state.json is replaced at the end, and
+# readers only open files of committed exports, so a crashed export is never
+# half-read (its files are swept by the next export).
+# Reads go through pyarrow.dataset: only the requested columns are decoded,
+# date/bucket directories outside the filter are skipped, and the remaining
+# predicates are checked against row-group statistics before any row is read.
+# Caveat: the transactions watermark is the highest exported id, so a row whose
+# id was assigned before the export but committed after it is not picked up.
+
+OFFLINE_STORE_DIR = os.getenv("OFFLINE_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "offline_store"))
+USER_BUCKETS = int(os.getenv("OFFLINE_USER_BUCKETS", 16))
+EXPORT_FETCH_ROWS = 100000
+ROWS_PER_GROUP = 128 * 1024
+STATE_FILE = "_state.json"
+
+TRANSACTIONS_SQL = """
+SELECT id, user_id, amount::float8, timestamp, is_flagged, timestamp::date
+FROM transactions_log WHERE id > %s ORDER BY id
+"""
+USER_FEATURES_SQL = "SELECT user_id, total_spent::float8, average_transaction_amount::float8 FROM user_historical_features"
+
+if pa is not None:
+    TRANSACTIONS_SCHEMA = pa.schema([("id", pa.int64()), ("user_id", pa.int32()), ("amount", pa.float64()),
+                                     ("timestamp", pa.timestamp("us")), ("is_flagged", pa.bool_()), ("date", pa.date32())])
+    USER_FEATURES_SCHEMA = pa.schema([("user_id", pa.int32()), ("total_spent", pa.float64()),
+                                      ("average_transaction_amount", pa.float64()), ("bucket", pa.int16())])
+
+
+def user_bucket(user_ids):
+    """Stable user-hash bucket (Knuth multiplicative hash), vectorized."""
+    return ((np.asarray(user_ids, dtype=np.uint64) * np.uint64(2654435761)) % np.uint64(2**32) % np.uint64(USER_BUCKETS)).astype(np.int16)
+
+
+def _conjoin(*exprs):
+    expr = None
+    for e in exprs:
+        if e is not None: expr = e if expr is None else expr & e
+    return expr
+
+
+def transaction_filter(user_id=None, start=None, end=None, min_amount=None, max_amount=None):
+    """pyarrow filter for the same arguments as TransactionColumns.mask (None = no filter)."""
+    start = np.datetime64(start, "s").astype(datetime) if start is not None else None
+    end = np.datetime64(end, "s").astype(datetime) if end is not None else None
+    return _conjoin(
+        ds.field("user_id") == user_id if user_id is not None else None,
+        # Partition pruning on the directory, then the exact bound on the column
+        ds.field("date") >= start.date() if start else None,
+        ds.field("timestamp") >= pa.scalar(start, pa.timestamp("us")) if start else None,
+        ds.field("date") <= end.date() if end else None,
+        ds.field("timestamp") < pa.scalar(end, pa.timestamp("us")) if end else None,
+        ds.field("amount") >= min_amount if min_amount is not None else None,
+        ds.field("amount") <= max_amount if max_amount is not None else None,
+    )
+
+
+class OfflineStore:
+    def __init__(self, root=OFFLINE_STORE_DIR):
+        self.root = root
+
+    # --- State ---
+
+    def state(self):
+        try:
+            with open(os.path.join(self.root, STATE_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"transactions": {"last_id": 0, "exports": []}, "user_features": {"export": None}}
+
+    def _save_state(self, state):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, STATE_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(path + ".tmp", path)  # atomic: readers see the old or the new export set
+
+    def available(self, table="transactions"):
+        return pa is not None and bool(self._files(table))
+
+    def _files(self, table, state=None):
+        state = state or self.state()
+        committed = set(state["transactions"]["exports"]) if table == "transactions" else {state["user_features"]["export"]}
+        files = glob.glob(os.path.join(self.root, table, "*", "part-*.parquet"))
+        return sorted(f for f in files if os.path.basename(f).split("-")[1] in committed)
+
+    def _sweep(self, table, keep):
+        """Delete part files of exports not in keep (crashed or superseded ones)."""
+        for path in glob.glob(os.path.join(self.root, table, "*", "part-*.parquet")):
+            if os.path.basename(path).split("-")[1] not in keep: os.remove(path)
+
+    # --- Export ---
+
+    def _write(self, table, batches, schema, partition_by, export_id):
+        ds.write_dataset(
+            batches, os.path.join(self.root, table), schema=schema, format="parquet",
+            partitioning=ds.partitioning(pa.schema([schema.field(partition_by)]), flavor="hive"),
+            basename_template=f"part-{export_id}-{{i}}.parquet", existing_data_behavior="overwrite_or_ignore",
+            max_rows_per_group=ROWS_PER_GROUP, min_rows_per_group=min(ROWS_PER_GROUP, EXPORT_FETCH_ROWS),
+            file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+        )
+
+    def export_transactions(self, conn, full=False):
+        """Append transactions_log rows past the watermark (or everything, with full=True). Returns rows."""
+        state = self.state()
+        committed = set(state["transactions"]["exports"])
+        tx_state = {"last_id": 0, "exports": []} if full else state["transactions"]
+        export_id = uuid.uuid4().hex[:12]
+        self._sweep("transactions", committed)  # leftovers of a crashed export
+        stats = {"rows": 0, "last_id": tx_state["last_id"]}
+
+        def batches():
+            with conn.cursor(name="offline_export") as cur:
+                cur.itersize = EXPORT_FETCH_ROWS
+                cur.execute(TRANSACTIONS_SQL, (tx_state["last_id"],))
+                while True:
+                    rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+                    if not rows: break
+                    columns = list(zip(*rows))
+                    stats["rows"] += len(rows)
+                    stats["last_id"] = columns[0][-1]
+                    yield pa.record_batch([pa.array(c, type=f.type) for c, f in zip(columns, TRANSACTIONS_SCHEMA)],
+                                          schema=TRANSACTIONS_SCHEMA)
+
+        try:
+            self._write("transactions", batches(), TRANSACTIONS_SCHEMA, "date", export_id)
+        except BaseException:
+            self._sweep("transactions", committed)
+            raise
+        finally:
+            conn.rollback()
+        if stats["rows"] or full:
+            if stats["rows"]: tx_state["exports"].append(export_id)
+            tx_state["last_id"] = stats["last_id"]
+            tx_state["exported_at"] = datetime.now().isoformat(sep=" ", timespec="seconds")
+            state["transactions"] = tx_state
+            self._save_state(state)
+        # A full export replaces the old files, which readers stop opening once the state is saved
+        if full: self._sweep("transactions", set(tx_state["exports"]))
+        return stats["rows"]
+
+    def export_user_features(self, conn):
+        """Replace the user_historical_features snapshot. Returns rows."""
+        state = self.state()
+        export_id = uuid.uuid4().hex[:12]
+        with conn.cursor() as cur:
+            cur.execute(USER_FEATURES_SQL)
+            rows = cur.fetchall()
+        conn.rollback()
+        user_id, total, avg = (list(c) for c in zip(*rows)) if rows else ([], [], [])
+        batch = pa.record_batch([pa.array(user_id, pa.int32()), pa.array(total, pa.float64()),
+                                 pa.array(avg, pa.float64()), pa.array(user_bucket(user_id), pa.int16())],
+                                schema=USER_FEATURES_SCHEMA)
+        try:
+            self._write("user_features", [batch], USER_FEATURES_SCHEMA, "bucket", export_id)
+        except BaseException:
+            self._sweep("user_features", {state["user_features"]["export"]})
+            raise
+        state["user_features"] = {"export": export_id, "exported_at": datetime.now().isoformat(sep=" ", timespec="seconds")}
+        self._save_state(state)
+        self._sweep("user_features", {export_id})
+        return len(rows)
+
+    # --- Read ---
+
+    def scan(self, table, columns=None, filter=None):
+        """pyarrow Table of the committed files, decoding only `columns`, pruned by `filter`."""
+        if pa is None: raise RuntimeError("pyarrow is not installed")
+        files = self._files(table)
+        if not files: raise FileNotFoundError(f"No '{table}' export in {self.root}")
+        schema = TRANSACTIONS_SCHEMA if table == "transactions" else USER_FEATURES_SCHEMA
+        partition_by = "date" if table == "transactions" else "bucket"
+        dataset = ds.dataset(files, schema=schema, format="parquet", partition_base_dir=os.path.join(self.root, table),
+                             partitioning=ds.partitioning(pa.schema([schema.field(partition_by)]), flavor="hive"))
+        return dataset.to_table(columns=columns, filter=filter)
+
+    def transactions(self, columns=None, user_id=None, start=None, end=None, min_amount=None, max_amount=None):
+        return self.scan("transactions", columns, transaction_filter(user_id, start, end, min_amount, max_amount))
+
+    def transaction_columns(self, user_id=None, start=None, end=None, min_amount=None, max_amount=None):
+        """Filtered transactions as csv_analytics.TransactionColumns, so the CSV analytics code runs on them."""
+        t = self.transactions(["user_id", "amount", "timestamp"], user_id, start, end, min_amount, max_amount)
+        return TransactionColumns(t["user_id"].to_numpy().astype(np.int64), t["amount"].to_numpy(),
+                                  t["timestamp"].to_numpy().astype("datetime64[s]"))
+
+    def user_features(self, columns=None, user_ids=None):
+        """Snapshot of user_historical_features; user_ids only opens their buckets."""
+        filter = None
+        if user_ids is not None:
+            filter = ds.field("bucket").isin(np.unique(user_bucket(user_ids)).tolist()) & ds.field("user_id").isin(list(user_ids))
+        return self.scan("user_features", columns, filter)
+
+    def info(self):
+        state = self.state()
+        out = {}
+        for table in ("transactions", "user_features"):
+            files = self._files(table, state)
+            out[table] = {"files": len(files), "bytes": sum(os.path.getsize(f) for f in files),
+                          "partitions": len({os.path.basename(os.path.dirname(f)) for f in files})}
+        out["state"] = state
+        return out
+
+
+def export(full=False, tables=("transactions", "user_features"), root=OFFLINE_STORE_DIR):
+    try:
+        if pa is None: raise RuntimeError("pyarrow is not installed (pip install pyarrow)")
+        conn = psycopg2.connect(dbname=PG_DBNAME, user=PG_USER, password=PG_PASS, host=PG_HOST, port=PG_PORT)
+        store = OfflineStore(root)
+        print(f"--- Exporting offline store to {root} ---")
+        for table in tables:
+            started = time.perf_counter()
+            if table == "transactions": rows = store.export_transactions(conn, full)
+            else: rows = store.export_user_features(conn)
+            elapsed = time.perf_counter() - started
+            print(f"✅ {table}: {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/sec).")
+        conn.close()
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export transactions_log and user_historical_features to partitioned Parquet.")
+    parser.add_argument("--full", action="store_true", help="Re-export all transactions instead of appending new ones (also compacts the appended files)")
+    parser.add_argument("--tables", default="transactions,user_features", help="Comma-separated subset to export")
+    parser.add_argument("--root", default=OFFLINE_STORE_DIR)
+    parser.add_argument("--info", action="store_true", help="Show what is in the store and exit")
+    args = parser.parse_args()
+    if args.info:
+        print(json.dumps(OfflineStore(args.root).info(), indent=2))
+    else:
+        export(args.full, [t.strip() for t in args.tables.split(",") if t.strip()], args.root)
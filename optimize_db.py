@@ -1,9 +1,21 @@
 import psycopg2
 import os
 from dotenv import load_dotenv
+from partitions import is_partitioned
 
 load_dotenv()
 
+DAILY_SALES_VIEW_SQL = """
+    CREATE MATERIALIZED VIEW daily_sales_summary AS
+    SELECT 
+        date_trunc('day', timestamp) AS sales_day, 
+        SUM(amount) AS total_sales,
+        COUNT(*) as tx_count
+    FROM transactions_log
+    GROUP BY sales_day
+    ORDER BY sales_day DESC;
+"""
+
 # DB Config
 PG_DBNAME = os.getenv("POSTGRES_DB", "feature_store")
 PG_USER = os.getenv("POSTGRES_USER", "postgres")
@@ -21,25 +33,26 @@ def optimize_database():
 
         # 1. Create Indexes (Speed up User Search)
         print("1. Creating B-Tree Indexes...")
-        # Index on user_id (Speed up finding user history)
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_user_id ON transactions_log(user_id);")
-        # Index on timestamp (Speed up finding recent transactions)
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_timestamp ON transactions_log(timestamp DESC);")
-        print("✅ Indexes created on 'user_id' and 'timestamp'.")
+        if is_partitioned(cur):
+            # Partitioned (setup_partitions.py): timestamp indexes are per partition, B-tree or BRIN
+            print("ℹ️ 'transactions_log' is partitioned; timestamp indexes are managed by partitions.py.")
+        else:
+            # Index on user_id (Speed up finding user history)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_user_id ON transactions_log(user_id);")
+            # Index on timestamp (Speed up finding recent transactions)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_timestamp ON transactions_log(timestamp DESC);")
+        # Composite index for keyset pagination of a user's history: id is the tiebreaker, INCLUDE
+        # makes it index-only. Replaces the older (user_id, timestamp DESC) index.
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_user_ts_id ON transactions_log(user_id, timestamp DESC, id DESC) INCLUDE (amount);")
+        cur.execute("DROP INDEX IF EXISTS idx_tx_user_ts;")
+        print("✅ Indexes created on 'user_id', 'timestamp' and '(user_id, timestamp DESC, id DESC)'.")
 
         # 2. Create Materialized View (Speed up Analytics)
         print("2. Creating Materialized View for Daily Sales...")
         cur.execute("DROP MATERIALIZED VIEW IF EXISTS daily_sales_summary;")
-        cur.execute("""
-            CREATE MATERIALIZED VIEW daily_sales_summary AS
-            SELECT 
-                date_trunc('day', timestamp) AS sales_day, 
-                SUM(amount) AS total_sales,
-                COUNT(*) as tx_count
-            FROM transactions_log
-            GROUP BY sales_day
-            ORDER BY sales_day DESC;
-        """)
+        cur.execute(DAILY_SALES_VIEW_SQL)
+        # Unique index lets rollups.py use REFRESH MATERIALIZED VIEW CONCURRENTLY
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_daily_sales_summary_day ON daily_sales_summary(sales_day);")
         print("✅ Materialized View 'daily_sales_summary' created.")
 
         cur.close()
@@ -0,0 +1,155 @@
+import os
+from datetime import date, datetime
+
+# --- Monthly partitions of transactions_log ---
+# After setup_partitions.py, transactions_log is range-partitioned by month:
+#   transactions_log_p2025_01   [2025-01-01, 2025-02-01)
+#   ...
+#   transactions_log_default    catch-all, so an insert never fails for lack of a partition
+# Lifecycle, all idempotent:
+#   - ensure_future_partitions: next PARTITION_MONTHS_AHEAD months exist (run by the API's scheduler)
+#   - apply_index_policy: hot months keep a B-tree on timestamp for ORDER BY ... LIMIT;
+#     cold months get a BRIN index instead (a few pages per partition vs. GBs of B-tree)
+#   - archive_partitions: detach months older than the retention window, record their
+#     totals in transactions_archive_totals, then move them to the archive schema or
+#     dump them to CSV and drop them
+
+PARENT = "transactions_log"
+DEFAULT_PARTITION = "transactions_log_default"
+ARCHIVE_SCHEMA = "archive"
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+PARTITION_HOT_MONTHS = int(os.getenv("PARTITION_HOT_MONTHS", 2))
+PARTITION_LOCK_ID = 8112  # pg advisory lock so only one worker does partition maintenance
+
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def add_months(d, n):
+    index = d.year * 12 + d.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARENT}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", (PARENT,))
+    return cur.fetchone()[0]
+
+
+def list_partitions(cur):
+    """[(name, month start)] of the monthly partitions, oldest first (default partition excluded)."""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (PARENT,))
+    prefix = f"{PARENT}_p"
+    months = []
+    for (name,) in cur.fetchall():
+        if name.startswith(prefix):
+            year, month = name[len(prefix):].split("_")
+            months.append((name, date(int(year), int(month), 1)))
+    return sorted(months, key=lambda item: item[1])
+
+
+def ensure_partition(cur, month, index=True):
+    """Create the partition for `month` if missing. Returns True if it was created.
+
+    Rows for that month already sitting in the default partition are moved
+    into the new partition first (ATTACH would fail otherwise).
+    """
+    name = partition_name(month)
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    if cur.fetchone()[0]: return False
+    start, end = month, add_months(month, 1)
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (DEFAULT_PARTITION,))
+    has_default = cur.fetchone()[0]
+    stranded = False
+    if has_default:
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s)", (start, end))
+        stranded = cur.fetchone()[0]
+    if stranded:
+        # Build it detached (no triggers fire on a plain table), then attach
+        cur.execute(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cur.execute(f"""
+            WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s RETURNING *)
+            INSERT INTO {name} SELECT * FROM moved
+        """, (start, end))
+        cur.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    else:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    if index:
+        # New partitions are hot until apply_index_policy says otherwise
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name}_ts_idx ON {name} (timestamp DESC)")
+    return True
+
+
+def ensure_future_partitions(conn, months_ahead=PARTITION_MONTHS_AHEAD, today=None):
+    """Create partitions from the current month to `months_ahead` months out. Returns names created."""
+    created = []
+    with conn.cursor() as cur:
+        if not is_partitioned(cur): return created
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (PARTITION_LOCK_ID,))
+        if not cur.fetchone()[0]: return created
+        current = month_start(today or datetime.now())
+        for i in range(months_ahead + 1):
+            month = add_months(current, i)
+            if ensure_partition(cur, month): created.append(partition_name(month))
+    return created
+
+
+def apply_index_policy(conn, hot_months=PARTITION_HOT_MONTHS, today=None):
+    """B-tree on timestamp for the current and previous hot_months-1 months (and the future), BRIN for older ones."""
+    first_hot = add_months(month_start(today or datetime.now()), -(hot_months - 1))
+    changes = {"brin": [], "btree": []}
+    with conn.cursor() as cur:
+        for name, month in list_partitions(cur):
+            if month < first_hot:
+                cur.execute("SELECT to_regclass(%s) IS NULL", (f"{name}_ts_brin",))
+                if cur.fetchone()[0]:
+                    cur.execute(f"CREATE INDEX {name}_ts_brin ON {name} USING brin (timestamp) WITH (pages_per_range = 32)")
+                    changes["brin"].append(name)
+                cur.execute(f"DROP INDEX IF EXISTS {name}_ts_idx")
+            else:
+                cur.execute("SELECT to_regclass(%s) IS NULL", (f"{name}_ts_idx",))
+                if cur.fetchone()[0]:
+                    cur.execute(f"CREATE INDEX {name}_ts_idx ON {name} (timestamp DESC)")
+                    changes["btree"].append(name)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {DEFAULT_PARTITION}_ts_idx ON {DEFAULT_PARTITION} (timestamp DESC)")
+    return changes
+
+
+def archive_partitions(conn, retain_months, archive_dir=None, today=None):
+    """Detach partitions entirely older than retain_months.
+
+    Their row count and volume go to transactions_archive_totals first, so
+    counter reconciliation (rollups.py) still matches the dashboard. With
+    archive_dir each one is dumped to <archive_dir>/<name>.csv and dropped;
+    otherwise it is kept as a plain table in the archive schema.
+    """
+    cutoff = add_months(month_start(today or datetime.now()), -retain_months)
+    archived = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_ID,))
+        for name, month in list_partitions(cur):
+            if add_months(month, 1) > cutoff: break
+            cur.execute(f"""
+                INSERT INTO transactions_archive_totals (partition_name, tx_count, total_amount)
+                SELECT %s, COUNT(*), COALESCE(SUM(amount), 0) FROM {name}
+                ON CONFLICT (partition_name) DO UPDATE
+                SET tx_count = EXCLUDED.tx_count, total_amount = EXCLUDED.total_amount, archived_at = now()
+            """, (name,))
+            cur.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+            if archive_dir:
+                path = os.path.join(archive_dir, f"{name}.csv")
+                with open(path, "w", encoding="utf-8") as f:
+                    cur.copy_expert(f"COPY {name} TO STDOUT WITH CSV HEADER", f)
+                cur.execute(f"DROP TABLE {name}")
+            else:
+                cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+                cur.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+            archived.append(name)
+    return archived
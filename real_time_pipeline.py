@@ -2,7 +2,15 @@ import psycopg2
 import redis
 import random
 import time
+import csv
+import argparse
+import threading
+import queue
+import requests
 from datetime import datetime
+from feature_registry import features
+from feature_cache import INVALIDATION_CHANNEL, invalidation_message
+from live_feed import TRANSACTION_STREAM, STREAM_MAXLEN, stream_entry
 
 # --- Database Connection Config ---
 DB_NAME = "feature_store"
@@ -11,71 +19,76 @@ DB_PASS = "Sanvi@123" # Your password
 DB_HOST = "127.0.0.1"
 DB_PORT = "5433"      # <-- The new port
 
-# Redis key for the 1-hour transaction count
-TRANSACTIONS_1H_KEY = "user:{user_id}:transactions_in_last_hour"
-# Redis key for the last transaction amount
-LAST_TRANSACTION_KEY = "user:{user_id}:last_transaction_amount"
-HOUR_IN_SECONDS = 3600
+# Online features (last amount, 5m/1h/24h sliding windows) share one Redis hash
+# per user, declared in feature_registry.py
+
+API_URL = "http://127.0.0.1:8000"
 
 # Initialize variables for the finally block
 pg_conn = None
 pg_cur = None
 
+def connect_pg():
+    conn = psycopg2.connect(
+        dbname=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
+    )
+    conn.autocommit = True
+    return conn
+
+def connect_redis():
+    r = redis.Redis(host='127.0.0.1', port=6379, decode_responses=True)
+    r.ping()
+    return r
+
+def write_event(pg_cur, r, user_id, amount, timestamp):
+    # 1. Write to Offline Store (PostgreSQL)
+    # The incremental trigger updates the user's running average in the same
+    # statement; read it back in the same round trip
+    insert_sql = """
+        INSERT INTO transactions_log (user_id, amount, timestamp) VALUES (%s, %s, %s);
+        SELECT average_transaction_amount FROM user_historical_features WHERE user_id = %s;
+    """
+    pg_cur.execute(insert_sql, (user_id, amount, timestamp, user_id))
+    row = pg_cur.fetchone()
+
+    # 2. Write to Online Store (Redis)
+    # One round trip: the feature script (last amount + every sliding window,
+    # applied atomically server-side), the new historical_avg plus an L1
+    # invalidation for the API workers, and the live dashboard entry
+    pipe = r.pipeline(transaction=False)
+    features.apply_transactions(r, [(user_id, amount, timestamp.timestamp(), None)], pipe=pipe)
+    if row and row[0] is not None:
+        features.write(pipe, user_id, {"historical_avg": float(row[0])})
+        pipe.publish(INVALIDATION_CHANNEL, invalidation_message([user_id]))
+    pipe.xadd(TRANSACTION_STREAM, stream_entry(user_id, amount, timestamp, False), maxlen=STREAM_MAXLEN, approximate=True)
+    pipe.execute()
+
 def start_pipeline():
     global pg_conn, pg_cur  # Use the global variables
-    
+
     try:
         # Connect to PostgreSQL (Offline Store)
-        pg_conn = psycopg2.connect(
-            dbname=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-        pg_conn.autocommit = True 
+        pg_conn = connect_pg()
         pg_cur = pg_conn.cursor()
         print("✅ PostgreSQL connection successful.")
-        
+
         # Connect to Redis (Online Store)
-        r = redis.Redis(host='127.0.0.1', port=6379, decode_responses=True) 
-        r.ping()
+        r = connect_redis()
         print("✅ Redis connection successful.")
-        
+
         print("\n--- Starting Real-time Pipeline (Press Ctrl+C to stop) ---\n")
-        
+
         while True:
-            # 1. Simulate a new event
-            user_id = random.randint(1, 500) 
+            # Simulate a new event
+            user_id = random.randint(1, 500)
             amount = round(random.uniform(5.0, 500.0), 2)
             timestamp = datetime.now()
-            
-            # 2. Write to Offline Store (PostgreSQL)
-            insert_sql = "INSERT INTO transactions_log (user_id, amount, timestamp) VALUES (%s, %s, %s)"
-            pg_cur.execute(insert_sql, (user_id, amount, timestamp))
-            
-            # 3. Write to Online Store (Redis)
-            
-            # Get the keys for this user
-            last_tx_key = LAST_TRANSACTION_KEY.format(user_id=user_id)
-            tx_1h_key = TRANSACTIONS_1H_KEY.format(user_id=user_id)
-
-            # *** CORRECTED REDIS LOGIC ***
-            # Use a 'pipeline' to send all commands at once
-            pipe = r.pipeline()
-            
-            # a) Set 'last_transaction_amount'
-            pipe.set(last_tx_key, amount)
-            
-            # b) Increment 'transactions_in_last_hour'
-            pipe.incr(tx_1h_key)
-            
-            # c) Set/reset the 1-hour expiration on the counter key
-            pipe.expire(tx_1h_key, HOUR_IN_SECONDS)
-            
-            # d) Execute all commands in the pipeline
-            pipe.execute()
-            # *******************************
-            
+
+            write_event(pg_cur, r, user_id, amount, timestamp)
+
             print(f"[{timestamp.strftime('%H:%M:%S')}] User {user_id} transaction: ${amount}. Updated real-time features.")
-            
-            time.sleep(random.uniform(1.0, 3.0)) 
+
+            time.sleep(random.uniform(1.0, 3.0))
 
     except KeyboardInterrupt:
         print("\nPipeline stopped by user.")
@@ -89,5 +102,157 @@ def start_pipeline():
             pg_conn.close()
         print("Database connections closed.")
 
+# --- Replay / Load Generation ---
+
+def read_events(path, assume_sorted=False):
+    """Yield (user_id, amount, timestamp) from a transactions.csv-style file in timestamp order.
+
+    Unsorted files are loaded and sorted in memory; pass assume_sorted=True
+    to stream a pre-sorted file of any size.
+    """
+    def parse(f):
+        reader = csv.reader(f)
+        next(reader)  # header
+        for row in reader:
+            try:
+                yield int(row[0]), float(row[1]), datetime.fromisoformat(row[2])
+            except (ValueError, IndexError):
+                continue
+
+    with open(path, 'r', encoding='utf-8') as f:
+        if assume_sorted:
+            yield from parse(f)
+        else:
+            yield from sorted(parse(f), key=lambda e: e[2])
+
+def percentile(sorted_values, p):
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+class ReplayStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lags = []
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, lag, status=None):
+        with self.lock:
+            self.lags.append(lag)
+            if status: self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def error(self):
+        with self.lock:
+            self.errors += 1
+
+def replay(path="transactions.csv", target="store", rate=None, speedup=None, concurrency=4,
+           hot_users=0, hot_share=0.0, limit=None, keep_timestamps=False, assume_sorted=False,
+           api_url=API_URL, seed=None):
+    """Replay a CSV against the online/offline store or the HTTP API and report throughput and lag.
+
+    Pacing: rate= sends a fixed events/sec; speedup= keeps the original gaps
+    between events compressed by that factor; neither = as fast as possible.
+    Lag is measured from an event's scheduled send time until its feature
+    update has been acknowledged, so it includes any queueing behind slow workers.
+    """
+    rng = random.Random(seed)
+    events = queue.Queue(maxsize=concurrency * 100)
+    stats = ReplayStats()
+
+    # Open every connection up front so a bad config fails before any worker starts
+    if target == "api":
+        clients = [requests.Session() for _ in range(concurrency)]
+    else:
+        r = connect_redis()  # thread-safe, shared by all workers
+        clients = [connect_pg() for _ in range(concurrency)]
+
+    def worker(client):
+        if target != "api":
+            cur = client.cursor()
+        try:
+            while True:
+                item = events.get()
+                if item is None: break
+                scheduled, user_id, amount, timestamp = item
+                delay = scheduled - time.perf_counter()
+                if delay > 0: time.sleep(delay)
+                try:
+                    if target == "api":
+                        res = client.post(f"{api_url}/submit-transaction", json={"user_id": user_id, "amount": amount}, timeout=10)
+                        res.raise_for_status()
+                        status = res.json().get("status")
+                    else:
+                        write_event(cur, r, user_id, amount, timestamp)
+                        status = "Written"
+                    stats.record(time.perf_counter() - scheduled, status)
+                except Exception as e:
+                    stats.error()
+                    if stats.errors == 1: print(f"❌ First replay error: {e}")
+        finally:
+            if target != "api":
+                cur.close()
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(client,), daemon=True) for client in clients]
+    for t in threads: t.start()
+
+    print(f"\n--- Replaying '{path}' against {target} ({concurrency} workers, Ctrl+C to stop) ---\n")
+    start = time.perf_counter()
+    sent = 0
+    first_ts = None
+    try:
+        for user_id, amount, ts in read_events(path, assume_sorted):
+            if limit is not None and sent >= limit: break
+            first_ts = first_ts or ts
+            # Hot-user skew: send a share of traffic to a small set of users
+            if hot_users and rng.random() < hot_share:
+                user_id = rng.randint(1, hot_users)
+            if rate:
+                scheduled = start + sent / rate
+            elif speedup:
+                scheduled = start + (ts - first_ts).total_seconds() / speedup
+            else:
+                scheduled = time.perf_counter()
+            timestamp = ts if keep_timestamps else datetime.now()
+            events.put((scheduled, user_id, amount, timestamp))
+            sent += 1
+    except KeyboardInterrupt:
+        print("\nReplay stopped by user.")
+    finally:
+        for _ in threads: events.put(None)
+        for t in threads: t.join()
+
+    elapsed = time.perf_counter() - start
+    lags = sorted(stats.lags)
+    done = len(lags)
+    print(f"✅ Sent {sent} events in {elapsed:.2f}s -> {done / elapsed if elapsed else 0:.1f} events/sec achieved")
+    print(f"   Errors: {stats.errors}  Statuses: {stats.statuses}")
+    print(f"   Feature-update lag ms: p50={percentile(lags, 50) * 1000:.1f} p95={percentile(lags, 95) * 1000:.1f} "
+          f"p99={percentile(lags, 99) * 1000:.1f} max={(lags[-1] if lags else 0) * 1000:.1f}")
+    return {"sent": sent, "completed": done, "errors": stats.errors, "elapsed": elapsed,
+            "throughput": done / elapsed if elapsed else 0.0,
+            "lag_p50": percentile(lags, 50), "lag_p95": percentile(lags, 95), "lag_p99": percentile(lags, 99)}
+
 if __name__ == "__main__":
-    start_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Real-time pipeline: random trickle (default) or CSV replay / load generation.")
+    parser.add_argument("--replay", metavar="CSV", help="Replay this CSV (transactions.csv schema) instead of random events")
+    parser.add_argument("--target", choices=["store", "api"], default="store", help="Write directly to Redis+Postgres, or POST to the API")
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--rate", type=float, help="Target events/sec")
+    parser.add_argument("--speedup", type=float, help="Time compression factor for the original event gaps")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--hot-users", type=int, default=0, help="Number of hot users (ids 1..N)")
+    parser.add_argument("--hot-share", type=float, default=0.0, help="Fraction of events redirected to hot users")
+    parser.add_argument("--limit", type=int, help="Stop after this many events")
+    parser.add_argument("--keep-timestamps", action="store_true", help="Write the CSV timestamps instead of now()")
+    parser.add_argument("--assume-sorted", action="store_true", help="Stream the CSV without sorting it first")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.replay:
+        replay(args.replay, target=args.target, rate=args.rate, speedup=args.speedup, concurrency=args.concurrency,
+               hot_users=args.hot_users, hot_share=args.hot_share, limit=args.limit,
+               keep_timestamps=args.keep_timestamps, assume_sorted=args.assume_sorted,
+               api_url=args.api_url, seed=args.seed)
+    else:
+        start_pipeline()
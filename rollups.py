@@ -0,0 +1,147 @@
+import asyncio
+import os
+
+from partitions import ensure_future_partitions
+
+# --- Incremental rollup refresh ---
+# Drains rollup_pending (filled by the trigger from setup_rollups.py) into the
+# hourly/daily/top-spender tables. DELETE ... RETURNING makes each pending row
+# count exactly once, even with several API workers running the scheduler:
+# rows from transactions that haven't committed yet simply wait for the next run.
+# Each upsert goes in key order, so concurrent writers lock rows in one order.
+
+ROLLUP_REFRESH_INTERVAL = float(os.getenv("ROLLUP_REFRESH_INTERVAL", 5))
+ROLLUP_VIEW_REFRESH_INTERVAL = float(os.getenv("ROLLUP_VIEW_REFRESH_INTERVAL", 900))
+COUNTER_RECONCILE_INTERVAL = float(os.getenv("COUNTER_RECONCILE_INTERVAL", 3600))
+PARTITION_CHECK_INTERVAL = float(os.getenv("PARTITION_CHECK_INTERVAL", 3600))
+VIEW_REFRESH_LOCK_ID = 8110  # pg advisory lock so only one worker refreshes the view
+ROLLUP_LOCK_ID = 8111        # serializes drains with counter reconciliation
+
+DRAIN_PENDING_SQL = """
+WITH drained AS (
+    DELETE FROM rollup_pending RETURNING sales_hour, user_id, amount_sum, tx_count
+),
+hourly AS (
+    INSERT INTO sales_hourly (sales_hour, total_sales, tx_count)
+    SELECT sales_hour, SUM(amount_sum), SUM(tx_count) FROM drained GROUP BY sales_hour ORDER BY sales_hour
+    ON CONFLICT (sales_hour) DO UPDATE
+    SET total_sales = sales_hourly.total_sales + EXCLUDED.total_sales,
+        tx_count = sales_hourly.tx_count + EXCLUDED.tx_count
+),
+daily AS (
+    INSERT INTO sales_daily (sales_day, total_sales, tx_count)
+    SELECT date_trunc('day', sales_hour), SUM(amount_sum), SUM(tx_count) FROM drained GROUP BY 1 ORDER BY 1
+    ON CONFLICT (sales_day) DO UPDATE
+    SET total_sales = sales_daily.total_sales + EXCLUDED.total_sales,
+        tx_count = sales_daily.tx_count + EXCLUDED.tx_count
+),
+spenders AS (
+    INSERT INTO user_spend_totals (user_id, total_spent)
+    SELECT user_id, SUM(amount_sum) FROM drained GROUP BY user_id ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET total_spent = user_spend_totals.total_spent + EXCLUDED.total_spent
+    RETURNING (xmax = 0) AS is_new_user
+),
+totals AS (
+    SELECT COALESCE(SUM(tx_count), 0) AS tx, COALESCE(SUM(amount_sum), 0) AS vol FROM drained
+),
+counters AS (
+    UPDATE global_counters
+    SET value = value + CASE name
+        WHEN 'total_transactions' THEN (SELECT tx FROM totals)
+        WHEN 'total_volume' THEN (SELECT vol FROM totals)
+        WHEN 'total_users' THEN (SELECT COUNT(*) FROM spenders WHERE is_new_user)
+        ELSE 0 END
+)
+SELECT tx FROM totals;
+"""
+
+# Recomputes the counters from the log to correct any drift. Counters only
+# cover drained rows, so whatever is still pending is subtracted; partitions
+# archived out of the log (partitions.py) are added back from their totals.
+RECONCILE_COUNTERS_SQL = """
+WITH log AS (
+    SELECT COUNT(*) + {archived_tx} AS tx, COALESCE(SUM(amount), 0) + {archived_vol} AS vol FROM transactions_log
+),
+pending AS (
+    SELECT COALESCE(SUM(tx_count), 0) AS tx, COALESCE(SUM(amount_sum), 0) AS vol FROM rollup_pending
+)
+UPDATE global_counters
+SET value = CASE name
+    WHEN 'total_transactions' THEN (SELECT log.tx - pending.tx FROM log, pending)
+    WHEN 'total_volume' THEN (SELECT log.vol - pending.vol FROM log, pending)
+    WHEN 'total_users' THEN (SELECT COUNT(*) FROM user_spend_totals)
+    ELSE value END;
+"""
+
+
+def drain_pending(conn):
+    """Fold pending deltas into the rollups. Returns the number of transactions applied."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('rollup_pending') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return 0  # setup_rollups.py hasn't been run
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (ROLLUP_LOCK_ID,))
+        cur.execute(DRAIN_PENDING_SQL)
+        return int(cur.fetchone()[0])
+
+
+def reconcile_counters(conn):
+    """Reset global_counters to exact values (full scan; runs rarely)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('global_counters') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return False
+        cur.execute("SELECT to_regclass('transactions_archive_totals') IS NOT NULL")
+        if cur.fetchone()[0]:
+            archived = {"archived_tx": "(SELECT COALESCE(SUM(tx_count), 0) FROM transactions_archive_totals)",
+                        "archived_vol": "(SELECT COALESCE(SUM(total_amount), 0) FROM transactions_archive_totals)"}
+        else:
+            archived = {"archived_tx": "0", "archived_vol": "0"}
+        # Taken before the recount so its snapshot can't miss a drain that commits meanwhile
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (ROLLUP_LOCK_ID,))
+        cur.execute(RECONCILE_COUNTERS_SQL.format(**archived))
+        return True
+
+
+def refresh_daily_view(conn):
+    """REFRESH MATERIALIZED VIEW CONCURRENTLY daily_sales_summary, if it exists and no one else is."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('daily_sales_summary') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return False
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (VIEW_REFRESH_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            return False
+        # CONCURRENTLY keeps the view readable during the refresh (needs the unique index from optimize_db.py)
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY daily_sales_summary")
+        return True
+
+
+async def rollup_scheduler(pg, interval=ROLLUP_REFRESH_INTERVAL, view_interval=ROLLUP_VIEW_REFRESH_INTERVAL,
+                           reconcile_interval=COUNTER_RECONCILE_INTERVAL, partition_interval=PARTITION_CHECK_INTERVAL):
+    """Background task: drain pending deltas every `interval` seconds, refresh the view
+    every `view_interval`, reconcile the global counters every `reconcile_interval`
+    and pre-create upcoming transactions_log partitions every `partition_interval`."""
+    loop = asyncio.get_running_loop()
+    next_view_refresh = loop.time() + view_interval
+    next_reconcile = loop.time() + reconcile_interval
+    next_partition_check = loop.time()
+    while True:
+        try:
+            if loop.time() >= next_partition_check:
+                next_partition_check = loop.time() + partition_interval
+                created = await pg.run(ensure_future_partitions)
+                if created: print(f"✅ Created partitions: {', '.join(created)}")
+            await pg.run(drain_pending)
+            if loop.time() >= next_view_refresh:
+                next_view_refresh = loop.time() + view_interval
+                await pg.run(refresh_daily_view)
+            if loop.time() >= next_reconcile:
+                next_reconcile = loop.time() + reconcile_interval
+                await pg.run(reconcile_counters)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Rollup refresh error: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,75 @@
+import datetime
+import decimal
+import json
+
+import numpy as np
+from starlette.responses import Response
+
+# --- Fast response serialization ---
+# Hot endpoints return these Response objects directly, which skips FastAPI's
+# jsonable_encoder walk over the result. orjson (or msgpack when the client
+# sends `Accept: application/msgpack`) then encodes datetimes, Decimals and
+# NumPy values natively or through one small default() hook. Both packages
+# are optional: without them the stdlib json module is used.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def _default(obj):
+    # Same conventions as FastAPI's encoder, so switching response classes changes no payloads
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(content):
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(content):
+        return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+class MsgpackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content):
+        return msgpack.packb(content, default=_default, use_bin_type=True, datetime=False)
+
+
+def wants_msgpack(request):
+    accept = request.headers.get("accept", "") if request is not None else ""
+    return msgpack is not None and any(t in accept for t in MSGPACK_MEDIA_TYPES)
+
+
+def respond(request, content, status_code=200):
+    """msgpack if the client asked for it (and msgpack is installed), JSON otherwise."""
+    headers = {"Vary": "Accept"}
+    if wants_msgpack(request):
+        return MsgpackResponse(content, status_code=status_code, headers=headers)
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
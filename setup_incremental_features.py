@@ -0,0 +1,105 @@
+import psycopg2
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# DB Config
+PG_DBNAME = os.getenv("POSTGRES_DB", "feature_store")
+PG_USER = os.getenv("POSTGRES_USER", "postgres")
+PG_PASS = os.getenv("POSTGRES_PASSWORD", "Sanvi@123")
+PG_HOST = os.getenv("POSTGRES_HOST", "127.0.0.1")
+PG_PORT = os.getenv("POSTGRES_PORT", "5433")
+
+INCREMENTAL_TRIGGER = "incremental_features_trigger"
+
+# Full rebuild from the log. Only needed once (or to repair drift);
+# after that the trigger keeps the running totals current.
+REBUILD_FEATURES_SQL = """
+INSERT INTO user_historical_features (user_id, total_spent, transaction_count, average_transaction_amount)
+SELECT
+    user_id,
+    SUM(amount) AS total_spent,
+    COUNT(*) AS transaction_count,
+    AVG(amount) AS average_transaction_amount
+FROM
+    transactions_log
+GROUP BY
+    user_id
+ON CONFLICT (user_id) DO UPDATE
+SET
+    total_spent = EXCLUDED.total_spent,
+    transaction_count = EXCLUDED.transaction_count,
+    average_transaction_amount = EXCLUDED.average_transaction_amount,
+    last_updated = CURRENT_TIMESTAMP;
+"""
+
+
+def incremental_trigger_installed(cur):
+    cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s", (INCREMENTAL_TRIGGER,))
+    return cur.fetchone() is not None
+
+
+def create_incremental_features():
+    try:
+        conn = psycopg2.connect(dbname=PG_DBNAME, user=PG_USER, password=PG_PASS, host=PG_HOST, port=PG_PORT)
+        cur = conn.cursor()
+
+        print("--- Setting up Incremental Historical Features ---")
+
+        # 1. Keep a running count next to the running sum so the average
+        #    can be updated without rescanning the log
+        print("1. Adding 'transaction_count' column...")
+        cur.execute("ALTER TABLE user_historical_features ADD COLUMN IF NOT EXISTS transaction_count BIGINT NOT NULL DEFAULT 0;")
+
+        # 2. Statement-level trigger: one grouped upsert per INSERT/COPY
+        #    statement (not per row), reading the new rows from a transition table.
+        #    Rows are upserted in user_id order so concurrent batches lock
+        #    them in the same order and can't deadlock each other.
+        print("2. Creating Trigger Function...")
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION apply_transaction_delta()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                INSERT INTO user_historical_features (user_id, total_spent, transaction_count, average_transaction_amount)
+                SELECT user_id, SUM(amount), COUNT(*), AVG(amount)
+                FROM new_rows
+                GROUP BY user_id
+                ORDER BY user_id
+                ON CONFLICT (user_id) DO UPDATE
+                SET
+                    total_spent = user_historical_features.total_spent + EXCLUDED.total_spent,
+                    transaction_count = user_historical_features.transaction_count + EXCLUDED.transaction_count,
+                    average_transaction_amount = (user_historical_features.total_spent + EXCLUDED.total_spent)
+                        / NULLIF(user_historical_features.transaction_count + EXCLUDED.transaction_count, 0),
+                    last_updated = CURRENT_TIMESTAMP;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        # 3. Seed the running totals and attach the trigger in one transaction.
+        #    The lock blocks writers so no row is counted twice or missed.
+        print("3. Seeding running totals and attaching Trigger to 'transactions_log'...")
+        cur.execute("LOCK TABLE transactions_log IN SHARE ROW EXCLUSIVE MODE;")
+        cur.execute(REBUILD_FEATURES_SQL)
+        cur.execute(f"""
+            DROP TRIGGER IF EXISTS {INCREMENTAL_TRIGGER} ON transactions_log;
+
+            CREATE TRIGGER {INCREMENTAL_TRIGGER}
+            AFTER INSERT ON transactions_log
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION apply_transaction_delta();
+        """)
+        conn.commit()
+
+        print("✅ Incremental feature maintenance configured successfully!")
+        cur.close()
+        conn.close()
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
+if __name__ == "__main__":
+    create_incremental_features()
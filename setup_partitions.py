@@ -0,0 +1,159 @@
+import argparse
+import psycopg2
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+from optimize_db import DAILY_SALES_VIEW_SQL
+from partitions import (PARENT, DEFAULT_PARTITION, PARTITION_MONTHS_AHEAD, PARTITION_HOT_MONTHS,
+                        is_partitioned, month_start, add_months, partition_name, ensure_partition,
+                        ensure_future_partitions, apply_index_policy, archive_partitions)
+
+load_dotenv()
+
+# DB Config
+PG_DBNAME = os.getenv("POSTGRES_DB", "feature_store")
+PG_USER = os.getenv("POSTGRES_USER", "postgres")
+PG_PASS = os.getenv("POSTGRES_PASSWORD", "Sanvi@123")
+PG_HOST = os.getenv("POSTGRES_HOST", "127.0.0.1")
+PG_PORT = os.getenv("POSTGRES_PORT", "5433")
+
+LEGACY_TABLE = "transactions_log_unpartitioned"
+
+def convert_to_partitioned(conn):
+    """Swap the plain transactions_log for a monthly-partitioned one holding the same rows.
+
+    Runs in one transaction with writers blocked. Triggers, the primary key,
+    the serial sequence and the daily_sales_summary view move to the new table;
+    the old heap is kept as transactions_log_unpartitioned until --drop-legacy.
+    """
+    cur = conn.cursor()
+    cur.execute(f"LOCK TABLE {PARENT} IN ACCESS EXCLUSIVE MODE;")
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (LEGACY_TABLE,))
+    if cur.fetchone()[0]: raise RuntimeError(f"'{LEGACY_TABLE}' already exists; drop it or rename it first")
+
+    # Things bound to the old table by OID, captured before the rename
+    cur.execute("""
+        SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger
+        WHERE tgrelid = %s::regclass AND NOT tgisinternal
+    """, (PARENT,))
+    triggers = cur.fetchall()
+    cur.execute("""
+        SELECT a.attname FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = %s::regclass AND i.indisprimary
+    """, (PARENT,))
+    pk_columns = [row[0] for row in cur.fetchall()]
+    cur.execute("""
+        SELECT a.attname, pg_get_serial_sequence(%s, a.attname) FROM pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+    """, (PARENT, PARENT))
+    sequences = [(col, seq) for col, seq in cur.fetchall() if seq]
+    cur.execute("SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE i.indrelid = %s::regclass", (PARENT,))
+    indexes = [row[0] for row in cur.fetchall()]
+    cur.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {PARENT}")
+    first_ts, last_ts = cur.fetchone()
+
+    print("1. Creating partitioned table...")
+    cur.execute("DROP MATERIALIZED VIEW IF EXISTS daily_sales_summary;")
+    cur.execute(f"ALTER TABLE {PARENT} RENAME TO {LEGACY_TABLE};")
+    for name, _ in triggers:
+        cur.execute(f"DROP TRIGGER {name} ON {LEGACY_TABLE};")
+    # Index (and PK constraint) names are schema-wide; free them for the new table
+    for name in indexes:
+        cur.execute(f"ALTER INDEX {name} RENAME TO {name[:45]}_unpartitioned;")
+    cur.execute(f"""
+        CREATE TABLE {PARENT} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE (timestamp);
+    """)
+    for col, seq in sequences:
+        cur.execute(f"ALTER SEQUENCE {seq} OWNED BY {PARENT}.{col};")
+    cur.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT;")
+
+    print("2. Creating monthly partitions...")
+    current = month_start(datetime.now())
+    month = month_start(first_ts) if first_ts else current
+    last = max(month_start(last_ts) if last_ts else current, add_months(current, PARTITION_MONTHS_AHEAD))
+    created = 0
+    while month <= last:
+        created += ensure_partition(cur, month, index=False)
+        month = add_months(month, 1)
+    print(f"✅ {created} partitions, {partition_name(month_start(first_ts) if first_ts else current)} .. {partition_name(last)}.")
+
+    print("3. Copying rows (triggers are not attached yet, so nothing is counted twice)...")
+    cur.execute(f"INSERT INTO {PARENT} SELECT * FROM {LEGACY_TABLE};")
+    print(f"✅ {cur.rowcount} rows copied.")
+
+    # Indexes after the copy: one build per index instead of row-by-row maintenance
+    print("4. Building indexes...")
+    if pk_columns:
+        # A partitioned table's primary key must include the partition key
+        key = pk_columns + (["timestamp"] if "timestamp" not in pk_columns else [])
+        cur.execute(f"ALTER TABLE {PARENT} ADD PRIMARY KEY ({', '.join(key)});")
+    # Per-user history stays one (partitioned) index; timestamp indexes are per partition (apply_index_policy)
+    cur.execute(f"CREATE INDEX idx_tx_user_ts_id ON {PARENT} (user_id, timestamp DESC, id DESC) INCLUDE (amount);")
+
+    print("5. Re-attaching triggers and the daily view...")
+    for name, definition in triggers:
+        # Captured before the rename, so the definitions already say ON transactions_log
+        cur.execute(definition)
+    cur.execute(DAILY_SALES_VIEW_SQL)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_daily_sales_summary_day ON daily_sales_summary(sales_day);")
+    print(f"✅ {len(triggers)} triggers moved: {', '.join(name for name, _ in triggers) or '-'}")
+    cur.close()
+
+def setup_partitions(months_ahead=PARTITION_MONTHS_AHEAD, hot_months=PARTITION_HOT_MONTHS,
+                     retain_months=None, archive_dir=None, drop_legacy=False):
+    try:
+        conn = psycopg2.connect(dbname=PG_DBNAME, user=PG_USER, password=PG_PASS, host=PG_HOST, port=PG_PORT)
+        cur = conn.cursor()
+
+        print("--- Setting up transactions_log Partitioning ---")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS transactions_archive_totals (
+                partition_name VARCHAR(63) PRIMARY KEY,
+                tx_count BIGINT NOT NULL,
+                total_amount DECIMAL NOT NULL,
+                archived_at TIMESTAMP NOT NULL DEFAULT now()
+            );
+        """)
+        if is_partitioned(cur):
+            print("✅ 'transactions_log' is already partitioned.")
+        else:
+            convert_to_partitioned(conn)
+        conn.commit()
+
+        # Lifecycle: each step commits on its own so a long one doesn't hold the others' locks
+        created = ensure_future_partitions(conn, months_ahead)
+        conn.commit()
+        print(f"✅ Future partitions: {', '.join(created) if created else 'already present'}.")
+
+        changes = apply_index_policy(conn, hot_months)
+        conn.commit()
+        print(f"✅ Index policy: {len(changes['brin'])} partitions moved to BRIN, {len(changes['btree'])} given a B-tree.")
+
+        if retain_months is not None:
+            archived = archive_partitions(conn, retain_months, archive_dir)
+            conn.commit()
+            target = f"dumped to {archive_dir}" if archive_dir else "moved to schema 'archive'"
+            print(f"✅ Archived {len(archived)} partitions ({target}).")
+
+        if drop_legacy:
+            cur.execute(f"DROP TABLE IF EXISTS {LEGACY_TABLE};")
+            conn.commit()
+            print(f"✅ Dropped '{LEGACY_TABLE}'.")
+
+        cur.close()
+        conn.close()
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition transactions_log by month and maintain the partitions (safe to rerun, e.g. from cron).")
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD, help="Future months to pre-create")
+    parser.add_argument("--hot-months", type=int, default=PARTITION_HOT_MONTHS, help="Recent months that keep a B-tree on timestamp; older ones get BRIN")
+    parser.add_argument("--retain-months", type=int, help="Detach partitions older than this many months")
+    parser.add_argument("--archive-dir", help="With --retain-months: dump detached partitions to CSV here and drop them")
+    parser.add_argument("--drop-legacy", action="store_true", help=f"Drop '{LEGACY_TABLE}' left by the conversion")
+    args = parser.parse_args()
+    setup_partitions(args.months_ahead, args.hot_months, args.retain_months, args.archive_dir, args.drop_legacy)
@@ -20,7 +20,7 @@ def create_procedures():
         print("--- Setting up Stored Procedures ---")
 
         # SQL to create the function
-        # This function runs multiple queries internally and returns the result as one row
+        # This function reads the maintained dashboard counters and returns them as one row
         procedure_sql = """
         CREATE OR REPLACE FUNCTION get_dashboard_metrics()
         RETURNS TABLE (
@@ -30,10 +30,11 @@ def create_procedures():
         ) 
         AS $$
         BEGIN
+            -- O(1): reads the counters kept by the rollup drain (setup_rollups.py)
             RETURN QUERY SELECT 
-                (SELECT COUNT(*) FROM transactions_log) AS total_tx,
-                (SELECT COALESCE(SUM(amount), 0) FROM transactions_log) AS total_vol,
-                (SELECT COUNT(*) FROM user_historical_features) AS total_users;
+                (SELECT value::BIGINT FROM global_counters WHERE name = 'total_transactions') AS total_tx,
+                (SELECT value FROM global_counters WHERE name = 'total_volume') AS total_vol,
+                (SELECT value::BIGINT FROM global_counters WHERE name = 'total_users') AS total_users;
         END;
         $$ LANGUAGE plpgsql;
         """
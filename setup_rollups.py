@@ -0,0 +1,115 @@
+import psycopg2
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# DB Config
+PG_DBNAME = os.getenv("POSTGRES_DB", "feature_store")
+PG_USER = os.getenv("POSTGRES_USER", "postgres")
+PG_PASS = os.getenv("POSTGRES_PASSWORD", "Sanvi@123")
+PG_HOST = os.getenv("POSTGRES_HOST", "127.0.0.1")
+PG_PORT = os.getenv("POSTGRES_PORT", "5433")
+
+ROLLUP_TRIGGER = "rollup_capture_trigger"
+
+def create_rollups():
+    try:
+        conn = psycopg2.connect(dbname=PG_DBNAME, user=PG_USER, password=PG_PASS, host=PG_HOST, port=PG_PORT)
+        cur = conn.cursor()
+
+        print("--- Setting up Analytics Rollups ---")
+
+        # 1. Rollup tables read by the analytics endpoints
+        print("1. Creating rollup tables...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sales_hourly (
+                sales_hour TIMESTAMP PRIMARY KEY,
+                total_sales DECIMAL NOT NULL DEFAULT 0,
+                tx_count BIGINT NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS sales_daily (
+                sales_day TIMESTAMP PRIMARY KEY,
+                total_sales DECIMAL NOT NULL DEFAULT 0,
+                tx_count BIGINT NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS user_spend_totals (
+                user_id INT PRIMARY KEY,
+                total_spent DECIMAL NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_user_spend_totals_total ON user_spend_totals(total_spent DESC);
+            -- Dashboard totals, bumped by every drain so /stats/global never scans
+            CREATE TABLE IF NOT EXISTS global_counters (
+                name VARCHAR(50) PRIMARY KEY,
+                value DECIMAL NOT NULL DEFAULT 0
+            );
+        """)
+
+        # 2. Pending deltas. The trigger appends one pre-aggregated row per
+        #    (hour, user) per INSERT/COPY statement; rollups.py drains it.
+        print("2. Creating 'rollup_pending' table and capture trigger...")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_pending (
+                sales_hour TIMESTAMP NOT NULL,
+                user_id INT NOT NULL,
+                amount_sum DECIMAL NOT NULL,
+                tx_count BIGINT NOT NULL
+            );
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION capture_rollup_delta()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                INSERT INTO rollup_pending (sales_hour, user_id, amount_sum, tx_count)
+                SELECT date_trunc('hour', timestamp), user_id, SUM(amount), COUNT(*)
+                FROM new_rows
+                GROUP BY 1, 2;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        # 3. Seed the rollups from the existing log and attach the trigger
+        #    atomically, with writers blocked, so nothing is counted twice or missed
+        print("3. Seeding rollups from 'transactions_log'...")
+        cur.execute("LOCK TABLE transactions_log IN SHARE ROW EXCLUSIVE MODE;")
+        cur.execute("TRUNCATE sales_hourly, sales_daily, user_spend_totals, rollup_pending;")
+        cur.execute("""
+            INSERT INTO sales_hourly (sales_hour, total_sales, tx_count)
+            SELECT date_trunc('hour', timestamp), SUM(amount), COUNT(*) FROM transactions_log GROUP BY 1;
+        """)
+        cur.execute("""
+            INSERT INTO sales_daily (sales_day, total_sales, tx_count)
+            SELECT date_trunc('day', sales_hour), SUM(total_sales), SUM(tx_count) FROM sales_hourly GROUP BY 1;
+        """)
+        cur.execute("""
+            INSERT INTO user_spend_totals (user_id, total_spent)
+            SELECT user_id, SUM(amount) FROM transactions_log GROUP BY user_id;
+        """)
+        cur.execute("""
+            INSERT INTO global_counters (name, value) VALUES
+                ('total_transactions', (SELECT COALESCE(SUM(tx_count), 0) FROM sales_daily)),
+                ('total_volume', (SELECT COALESCE(SUM(total_sales), 0) FROM sales_daily)),
+                ('total_users', (SELECT COUNT(*) FROM user_spend_totals))
+            ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value;
+        """)
+        cur.execute(f"""
+            DROP TRIGGER IF EXISTS {ROLLUP_TRIGGER} ON transactions_log;
+
+            CREATE TRIGGER {ROLLUP_TRIGGER}
+            AFTER INSERT ON transactions_log
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION capture_rollup_delta();
+        """)
+        conn.commit()
+
+        print("✅ Rollups configured successfully!")
+        cur.close()
+        conn.close()
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
+if __name__ == "__main__":
+    create_rollups()
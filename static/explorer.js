@@ -69,12 +69,7 @@ async function exploreUser(userId) {
             if (logData.transactions.length === 0) {
                 logEl.innerHTML = "<li>No transactions found.</li>";
             } else {
-                logData.transactions.forEach(tx => {
-                    const li = document.createElement('li');
-                    const txDate = new Date(tx.timestamp).toLocaleString();
-                    li.textContent = `$${parseFloat(tx.amount).toFixed(2)} on ${txDate}`;
-                    logEl.appendChild(li);
-                });
+                appendTransactions(userId, logData);
             }
         } else {
             logEl.innerHTML = "<li>No data available.</li>";
@@ -90,6 +85,35 @@ async function exploreUser(userId) {
     }
 }
 
+// Render one page of history; add a "Load more" row if the API returned a cursor
+function appendTransactions(userId, logData) {
+    logData.transactions.forEach(tx => {
+        const li = document.createElement('li');
+        const txDate = new Date(tx.timestamp).toLocaleString();
+        li.textContent = `$${parseFloat(tx.amount).toFixed(2)} on ${txDate}`;
+        logEl.appendChild(li);
+    });
+    if (!logData.next_cursor) return;
+
+    const moreLi = document.createElement('li');
+    const moreBtn = document.createElement('button');
+    moreBtn.textContent = "Load more";
+    moreBtn.addEventListener('click', async () => {
+        moreBtn.disabled = true;
+        try {
+            const res = await fetch(`${API_BASE_URL}/transactions/all/${userId}?cursor=${encodeURIComponent(logData.next_cursor)}`);
+            if (!res.ok) throw new Error("Failed to load more transactions");
+            moreLi.remove();
+            appendTransactions(userId, await res.json());
+        } catch (error) {
+            console.error(error);
+            moreBtn.disabled = false;
+        }
+    });
+    moreLi.appendChild(moreBtn);
+    logEl.appendChild(moreLi);
+}
+
 searchBtn.addEventListener('click', () => {
     exploreUser(userIdInput.value);
 });
@@ -28,60 +28,99 @@ const liveChart = new Chart(ctx, {
     }
 });
 
+function renderStats(data) {
+    totalTxEl.textContent = data.total_transactions.toLocaleString();
+    totalVolEl.textContent = `$${Number(data.total_volume).toLocaleString(undefined, {minimumFractionDigits: 2, maximumFractionDigits: 2})}`;
+    totalUsersEl.textContent = data.total_users.toLocaleString();
+}
+
+function pushChartPoint(value) {
+    liveChart.data.datasets[0].data.shift(); // Remove old
+    liveChart.data.datasets[0].data.push(value); // Add new
+    liveChart.update();
+}
+
 async function getGlobalStats() {
     try {
         const response = await fetch(`${API_BASE_URL}/stats/global`);
         if (!response.ok) throw new Error("Stats API failed");
         const data = await response.json();
         
-        totalTxEl.textContent = data.total_transactions.toLocaleString();
-        totalVolEl.textContent = `$${data.total_volume.toLocaleString(undefined, {minimumFractionDigits: 2, maximumFractionDigits: 2})}`;
-        totalUsersEl.textContent = data.total_users.toLocaleString();
+        renderStats(data);
         
         // Simulate Live Chart Update
-        const newData = Math.floor(Math.random() * 20);
-        liveChart.data.datasets[0].data.shift(); // Remove old
-        liveChart.data.datasets[0].data.push(newData); // Add new
-        liveChart.update();
+        pushChartPoint(Math.floor(Math.random() * 20));
 
     } catch (error) {
         console.error(error);
     }
 }
 
+function renderRecentTransactions(transactions) {
+    globalLogEl.innerHTML = ""; 
+    if (transactions.length === 0) {
+        globalLogEl.innerHTML = "<li>No transactions yet.</li>";
+        return;
+    }
+
+    transactions.forEach(tx => {
+        const li = document.createElement('li');
+        const txTime = new Date(tx.timestamp).toLocaleTimeString();
+        
+        let statusHtml = '';
+        let rowStyle = '';
+        if (tx.is_flagged) {
+            rowStyle = 'background-color: #ffe6e6; border-left: 5px solid red;'; 
+            statusHtml = `<span style="color: red; font-weight: bold; margin-left: 10px;">⚠️ FLAG: HIGH RISK</span>`;
+        }
+
+        li.style.cssText = rowStyle;
+        li.innerHTML = `<strong>User ${tx.user_id}</strong> paid <span style="color: green; font-weight: bold;">$${parseFloat(tx.amount).toFixed(2)}</span> at ${txTime} ${statusHtml}`;
+        globalLogEl.appendChild(li);
+    });
+}
+
 async function getRecentTransactions() {
     try {
         const response = await fetch(`${API_BASE_URL}/transactions/recent/global`);
         if (!response.ok) throw new Error("Recent Tx API failed");
         const data = await response.json();
-        
-        globalLogEl.innerHTML = ""; 
-        if (data.recent_transactions.length === 0) {
-            globalLogEl.innerHTML = "<li>No transactions yet.</li>";
-            return;
-        }
-
-        data.recent_transactions.forEach(tx => {
-            const li = document.createElement('li');
-            const txTime = new Date(tx.timestamp).toLocaleTimeString();
-            
-            let statusHtml = '';
-            let rowStyle = '';
-            if (tx.is_flagged) {
-                rowStyle = 'background-color: #ffe6e6; border-left: 5px solid red;'; 
-                statusHtml = `<span style="color: red; font-weight: bold; margin-left: 10px;">⚠️ FLAG: HIGH RISK</span>`;
-            }
-
-            li.style.cssText = rowStyle;
-            li.innerHTML = `<strong>User ${tx.user_id}</strong> paid <span style="color: green; font-weight: bold;">$${parseFloat(tx.amount).toFixed(2)}</span> at ${txTime} ${statusHtml}`;
-            globalLogEl.appendChild(li);
-        });
+        renderRecentTransactions(data.recent_transactions);
     } catch (error) { console.error(error); }
 }
 
-window.addEventListener('load', () => {
+// --- Fallback: poll if the browser/server can't do Server-Sent Events ---
+let pollingStarted = false;
+function startPolling() {
+    if (pollingStarted) return;
+    pollingStarted = true;
     getGlobalStats();
     getRecentTransactions();
     setInterval(getGlobalStats, 3000); // Update stats & chart every 3s
     setInterval(getRecentTransactions, 2000);
+}
+
+// --- Live feed: the server pushes stats + recent transactions as they change ---
+function startLiveFeed() {
+    if (!window.EventSource) return startPolling();
+    const source = new EventSource(`${API_BASE_URL}/stream/dashboard`);
+    let opened = false;
+    source.onopen = () => { opened = true; };
+    source.addEventListener('dashboard', (e) => {
+        const data = JSON.parse(e.data);
+        if (data.stats) renderStats(data.stats);
+        renderRecentTransactions(data.recent_transactions);
+        pushChartPoint(data.new_transactions);
+    });
+    source.onerror = () => {
+        // Never connected: give up on SSE. Otherwise EventSource reconnects by itself.
+        if (!opened) {
+            source.close();
+            startPolling();
+        }
+    };
+}
+
+window.addEventListener('load', () => {
+    startLiveFeed();
 });
\ No newline at end of file
@@ -0,0 +1,218 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from csv_analytics import parse_csv
+from windowed_features import DEFAULT_WINDOWS, parse_horizon
+
+# pyarrow streams the label file in blocks and writes the output column-wise
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pacsv = pq = None
+
+load_dotenv()
+
+# DB Config
+PG_DBNAME = os.getenv("POSTGRES_DB", "feature_store")
+PG_USER = os.getenv("POSTGRES_USER", "postgres")
+PG_PASS = os.getenv("POSTGRES_PASSWORD", "Sanvi@123")
+PG_HOST = os.getenv("POSTGRES_HOST", "127.0.0.1")
+PG_PORT = os.getenv("POSTGRES_PORT", "5433")
+
+# --- Point-in-time correct training data ---
+# For every label (user_id, event_timestamp) we compute features from the
+# transactions strictly BEFORE event_timestamp, so nothing from the labelled
+# event itself or the future leaks in. Labels are resolved with an as-of join
+# (np.searchsorted) over one sorted copy of the transaction log.
+# The label file is never held in memory: it is read LABEL_BLOCK_BYTES at a
+# time, each block is joined as NumPy arrays and written straight out as one
+# columnar batch (CSV, or Parquet for a .parquet output path).
+
+DB_FETCH_ROWS = 100000
+LABEL_BLOCK_BYTES = int(os.getenv("LABEL_BLOCK_BYTES", 32 << 20))
+
+
+def load_transactions_from_db():
+    """Stream transactions_log through a server-side cursor into NumPy arrays."""
+    conn = psycopg2.connect(dbname=PG_DBNAME, user=PG_USER, password=PG_PASS, host=PG_HOST, port=PG_PORT)
+    try:
+        users, amounts, stamps = [], [], []
+        with conn.cursor(name="training_export") as cur:
+            cur.itersize = DB_FETCH_ROWS
+            cur.execute("SELECT user_id, amount, EXTRACT(EPOCH FROM timestamp)::BIGINT FROM transactions_log")
+            while True:
+                rows = cur.fetchmany(DB_FETCH_ROWS)
+                if not rows: break
+                u, a, t = zip(*rows)
+                users.append(np.array(u, dtype=np.int64))
+                amounts.append(np.array(a, dtype=np.float64))
+                stamps.append(np.array(t, dtype=np.int64))
+        if not users:
+            return np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, np.int64)
+        return np.concatenate(users), np.concatenate(amounts), np.concatenate(stamps)
+    finally:
+        conn.close()
+
+
+def load_transactions_from_csv(path):
+    cols = parse_csv(path)
+    return cols.user_id, cols.amount, cols.timestamp.astype(np.int64)
+
+
+def load_transactions_from_parquet(root, user_ids=None, before=None):
+    """Read the Parquet export (offline_store.py), pushing the user and time filters into the scan."""
+    from offline_store import OfflineStore, transaction_filter, ds
+    expr = transaction_filter(end=before)
+    if user_ids is not None:
+        users = ds.field("user_id").isin(np.unique(user_ids).tolist())
+        expr = users if expr is None else expr & users
+    t = OfflineStore(root).scan("transactions", ["user_id", "amount", "timestamp"], expr)
+    return (t["user_id"].to_numpy().astype(np.int64), t["amount"].to_numpy(),
+            t["timestamp"].to_numpy().astype("datetime64[s]").astype(np.int64))
+
+
+class TransactionIndex:
+    """Transactions sorted by (user, time) with prefix sums for O(log n) as-of lookups."""
+
+    def __init__(self, user_id, amount, epoch_seconds):
+        order = np.lexsort((epoch_seconds, user_id))
+        self.user_id = user_id[order]
+        self.amount = amount[order]
+        self.ts = epoch_seconds[order]
+        self.users = np.unique(self.user_id)
+        self.t0 = int(self.ts.min()) if len(self.ts) else 0
+        # Single sortable key per row: dense user rank in the high bits, time offset in the low bits
+        self.keys = self._key(np.searchsorted(self.users, self.user_id), self.ts)
+        self.csum = np.concatenate(([0.0], np.cumsum(self.amount)))
+
+    def _key(self, rank, ts):
+        return (rank.astype(np.int64) << 34) + (ts - self.t0 + (1 << 33))
+
+    def as_of(self, user_id, epoch_seconds, horizons):
+        """Features for each (user_id, epoch_seconds) label, using rows with ts < label time."""
+        n = len(user_id)
+        rank = np.searchsorted(self.users, user_id)
+        known = (rank < len(self.users)) & (self.users[np.minimum(rank, len(self.users) - 1)] == user_id) if len(self.users) else np.zeros(n, bool)
+        rank = np.where(known, rank, 0)
+
+        start = np.searchsorted(self.keys, self._key(rank, np.full(n, self.t0 - (1 << 33))), side="left")
+        end = np.searchsorted(self.keys, self._key(rank, epoch_seconds), side="left")
+        end = np.where(known, end, start)
+
+        count = end - start
+        total = self.csum[end] - self.csum[start]
+        features = {
+            "last_transaction_amount": np.where(count > 0, self.amount[np.maximum(end - 1, 0)] if len(self.amount) else 0.0, 0.0),
+            "transaction_count": count,
+            "total_spent": np.round(total, 2),
+            "average_transaction_amount": np.round(np.divide(total, count, out=np.zeros(n), where=count > 0), 2),
+        }
+        for label, seconds in horizons.items():
+            lo = np.searchsorted(self.keys, self._key(rank, epoch_seconds - seconds), side="left")
+            lo = np.clip(lo, start, end)
+            features[f"count_{label}"] = end - lo
+            features[f"sum_{label}"] = np.round(self.csum[end] - self.csum[lo], 2)
+        return features
+
+
+def open_labels(path, keys_only=False):
+    """Label CSV: user_id, event_timestamp, then any extra columns (passed through untouched).
+
+    Returns (header, reader over RecordBatches of text columns). Rows with
+    the wrong number of fields are skipped. keys_only reads just the first
+    two columns.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        header = next(csv.reader(f))
+    reader = pacsv.open_csv(
+        path, read_options=pacsv.ReadOptions(block_size=LABEL_BLOCK_BYTES),
+        parse_options=pacsv.ParseOptions(invalid_row_handler=lambda row: "skip"),
+        convert_options=pacsv.ConvertOptions(column_types={name: pa.string() for name in header}, include_columns=header[:2] if keys_only else None),
+    )
+    return header, reader
+
+
+def label_keys(batch):
+    """(user_id, event epoch seconds) NumPy arrays for a batch of labels."""
+    user_id = pc.cast(batch.column(0), pa.int64()).to_numpy()
+    event_ts = pc.cast(batch.column(1), pa.timestamp("us")).to_numpy().astype("datetime64[s]").astype(np.int64)
+    return user_id, event_ts
+
+
+def label_scope(path):
+    """(labelled user ids, latest label time) from a pass over just the two key columns."""
+    _, reader = open_labels(path, keys_only=True)
+    users, latest = np.empty(0, np.int64), None
+    for batch in reader:
+        if not batch.num_rows: continue
+        user_id, event_ts = label_keys(batch)
+        users = np.union1d(users, user_id)
+        latest = event_ts.max() if latest is None else max(latest, event_ts.max())
+    return users, latest
+
+
+def build_training_set(labels_path, output_path, transactions_csv=None, windows=DEFAULT_WINDOWS, offline_store=None):
+    if pa is None: raise RuntimeError("training_data.py needs pyarrow (pip install pyarrow)")
+    started = time.perf_counter()
+    horizons = {w.strip(): parse_horizon(w) for w in windows.split(",") if w.strip()}
+
+    print("Loading transactions...")
+    if transactions_csv:
+        user_id, amount, ts = load_transactions_from_csv(transactions_csv)
+    elif offline_store:
+        # Only the labelled users, and nothing after the last label
+        label_users, latest = label_scope(labels_path)
+        before = np.datetime64(int(latest), "s") if latest is not None else None
+        user_id, amount, ts = load_transactions_from_parquet(offline_store, label_users, before)
+    else:
+        user_id, amount, ts = load_transactions_from_db()
+    index = TransactionIndex(user_id, amount, ts)
+    print(f"✅ Indexed {len(index.ts)} transactions for {len(index.users)} users.")
+
+    header, reader = open_labels(labels_path)
+    empty = index.as_of(np.empty(0, np.int64), np.empty(0, np.int64), horizons)
+    names = list(empty)
+    parquet = output_path.endswith(".parquet")
+    # CSV keeps the label columns as they were; Parquet stores the two keys typed
+    label_types = [pa.string()] * len(header)
+    if parquet: label_types[:2] = [pa.int64(), pa.timestamp("s")]
+    schema = pa.schema([(name, t) for name, t in zip(header, label_types)] +
+                       [(name, pa.from_numpy_dtype(empty[name].dtype)) for name in names])
+    if parquet: writer = pq.ParquetWriter(output_path, schema, compression="zstd")
+    else: writer = pacsv.CSVWriter(output_path, schema, write_options=pacsv.WriteOptions(quoting_style="needed"))
+    labels = 0
+    try:
+        for batch in reader:
+            if not batch.num_rows: continue
+            label_users, label_ts = label_keys(batch)
+            features = index.as_of(label_users, label_ts, horizons)
+            columns = batch.columns
+            if parquet: columns[:2] = [pa.array(label_users), pa.array(label_ts.astype("datetime64[s]"))]
+            writer.write_batch(pa.record_batch(columns + [pa.array(features[name]) for name in names], schema=schema))
+            labels += batch.num_rows
+    finally:
+        writer.close()
+    print(f"✅ Computed {len(names)} features for {labels} labels.")
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Wrote '{output_path}' in {elapsed:.2f}s ({labels / elapsed if elapsed else 0:.0f} labels/sec).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a point-in-time correct training set from a label file.")
+    parser.add_argument("labels", help="CSV with user_id,event_timestamp[,extra columns...]")
+    parser.add_argument("output", help="Where to write labels + features (.parquet for Parquet, otherwise CSV)")
+    parser.add_argument("--transactions-csv", help="Read transactions from this CSV instead of Postgres")
+    parser.add_argument("--offline-store", metavar="DIR", help="Read transactions from the Parquet export (offline_store.py) instead of Postgres")
+    parser.add_argument("--windows", default=DEFAULT_WINDOWS, help="Comma-separated horizons, e.g. 5m,1h,24h")
+    args = parser.parse_args()
+    build_training_set(args.labels, args.output, args.transactions_csv, args.windows, args.offline_store)
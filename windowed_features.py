@@ -0,0 +1,165 @@
+import math
+import os
+import time
+
+# --- Sliding-window velocity features ---
+# Each user's Redis hash holds a ring of time buckets per horizon (the app
+# shares the per-user feature hash from feature_registry.py).
+# A bucket field looks like "<horizon>:<slot>" -> "<bucket_id>|<count>|<sum>|<max>|<width>".
+# Bucket ids only mean something for the width they were computed with, so a
+# slot written with another width (VELOCITY_BUCKETS changed, or the older
+# four-part values without a width) counts as empty: it is ignored when read
+# and overwritten by the next event. stale_fields() lists the slots that no
+# longer belong to the layout, for feature_registry.py's migration to drop.
+# The slot is reused once its bucket falls out of the window, so memory per
+# user is capped at (horizons x buckets) fields and every update is O(1).
+# Windows are bucketed: a "1h" window with 30 buckets covers the last 58-60 minutes.
+# 30 buckets keeps the default 3 horizons (90 fields) plus the scalar features
+# under Redis's hash-max-listpack-entries (128), see feature_registry.py.
+
+VELOCITY_KEY = "user:{user_id}:velocity"
+DEFAULT_WINDOWS = os.getenv("VELOCITY_WINDOWS", "5m,1h,24h")
+DEFAULT_BUCKETS = int(os.getenv("VELOCITY_BUCKETS", 30))
+
+UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Bucket update shared by UPDATE_SCRIPT and the registry's transaction script
+# (feature_registry.py). horizons is the flat {label, width, buckets, ...}
+# list from SlidingWindows.horizon_args().
+RECORD_LUA = """
+local function record_velocity(key, ts, amount, horizons)
+    for i = 1, #horizons, 3 do
+        local label = horizons[i]
+        local width = tonumber(horizons[i + 1])
+        local n = tonumber(horizons[i + 2])
+        local bucket = math.floor(ts / width)
+        local field = label .. ':' .. (bucket % n)
+        local count, total, peak = 0, 0, amount
+        local stale = false
+        local current = redis.call('HGET', key, field)
+        if current then
+            local cb, cc, cs, cm, cw = string.match(current, '^([^|]+)|([^|]+)|([^|]+)|([^|]+)|([^|]+)$')
+            cb = tonumber(cb)
+            if not cb or tonumber(cw) ~= width then
+                -- Written with another bucket width: nothing in it is comparable, start over
+            elseif cb == bucket then
+                count, total, peak = tonumber(cc), tonumber(cs), math.max(tonumber(cm), amount)
+            elseif cb > bucket then
+                -- Late event older than this horizon's window: skip it
+                stale = true
+            end
+        end
+        if not stale then
+            redis.call('HSET', key, field, bucket .. '|' .. (count + 1) .. '|' .. (total + amount) .. '|' .. peak .. '|' .. width)
+        end
+    end
+end
+"""
+
+# Runs server-side so concurrent updates to the same user never race
+UPDATE_SCRIPT = RECORD_LUA + """
+local horizons = {}
+for i = 4, #ARGV do horizons[#horizons + 1] = ARGV[i] end
+record_velocity(KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[2]), horizons)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def parse_horizon(text):
+    """'5m' -> 300, '1h' -> 3600, '90' -> 90 (seconds)."""
+    text = text.strip().lower()
+    if text[-1] in UNIT_SECONDS:
+        return int(float(text[:-1]) * UNIT_SECONDS[text[-1]])
+    return int(text)
+
+
+class SlidingWindows:
+    """Bucketed count/sum/max over several horizons, stored in one hash per user."""
+
+    def __init__(self, windows=DEFAULT_WINDOWS, buckets=DEFAULT_BUCKETS, key=VELOCITY_KEY, ttl=None):
+        if isinstance(windows, str):
+            windows = [w for w in windows.split(",") if w.strip()]
+        self.buckets = buckets
+        # label -> bucket width in seconds
+        self.horizons = {w.strip(): max(1, math.ceil(parse_horizon(w) / buckets)) for w in windows}
+        # Key TTL: the longest window, or longer if the hash also holds other features
+        self.ttl = max([width * buckets for width in self.horizons.values()] + [ttl or 0])
+        self.key_template = key
+        self._scripts = {}
+
+    def key(self, user_id):
+        return self.key_template.format(user_id=user_id)
+
+    @property
+    def fields(self):
+        """Most bucket fields one user's hash can hold."""
+        return len(self.horizons) * self.buckets
+
+    def _script_for(self, client):
+        script = self._scripts.get(id(client))
+        if script is None:
+            script = self._scripts[id(client)] = client.register_script(UPDATE_SCRIPT)
+        return script
+
+    def horizon_args(self):
+        args = []
+        for label, width in self.horizons.items():
+            args += [label, width, self.buckets]
+        return args
+
+    def script_args(self, amount, ts):
+        return [ts, amount, self.ttl] + self.horizon_args()
+
+    def record(self, client, user_id, amount, ts=None, pipe=None):
+        """Add one transaction to every window.
+
+        Works with both sync and asyncio redis clients (await the result for
+        the latter). Pass pipe= to queue the update on an open pipeline.
+        """
+        ts = time.time() if ts is None else ts
+        script = self._script_for(client)
+        return script(keys=[self.key(user_id)], args=self.script_args(amount, ts), client=pipe)
+
+    def summarize(self, raw, now=None):
+        """Turn the raw HGETALL result into {label: {count, sum, max}}."""
+        now = time.time() if now is None else now
+        out = {label: {"count": 0, "sum": 0.0, "max": 0.0} for label in self.horizons}
+        for field, value in (raw or {}).items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            label = field.rsplit(":", 1)[0]
+            width = self.horizons.get(label)
+            if width is None:
+                continue  # another feature sharing the hash
+            if isinstance(value, bytes):
+                value = value.decode()
+            parts = value.split("|")
+            if len(parts) != 5 or parts[4] != str(width):
+                continue  # written with another bucket width: treated as empty
+            bucket, count, total, peak, _ = parts
+            if int(bucket) <= math.floor(now / width) - self.buckets:
+                continue  # slot holds a bucket that has slid out of the window
+            agg = out[label]
+            agg["count"] += int(count)
+            agg["sum"] += float(total)
+            agg["max"] = max(agg["max"], float(peak))
+        for agg in out.values():
+            agg["sum"] = round(agg["sum"], 2)
+        return out
+
+    def stale_fields(self, raw):
+        """Bucket fields of a raw hash that don't fit the current layout (unknown horizon,
+        slot past the bucket count, or written with another width)."""
+        stale = []
+        for field, value in (raw or {}).items():
+            name = field.decode() if isinstance(field, bytes) else field
+            label, sep, slot = name.rpartition(":")
+            if not sep or not slot.isdigit(): continue  # not a bucket field
+            if isinstance(value, bytes):
+                value = value.decode(errors="replace")
+            parts = value.split("|")
+            width = self.horizons.get(label)
+            if width is None or int(slot) >= self.buckets or len(parts) != 5 or parts[4] != str(width):
+                stale.append(field)
+        return stale
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+
+from metrics import ERRORS
+
+# Write-behind buffer config
+WRITE_BUFFER_MAX = int(os.getenv("WRITE_BUFFER_MAX", 10000))        # queued rows before callers block
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 500))          # rows per flush
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", 0.05))  # max seconds a row waits
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", 3))
+# Batches that still fail after the retries are appended here (JSON lines) and replayed on the next start()
+WRITE_SPILL_PATH = os.getenv("WRITE_SPILL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "write_buffer_spill.jsonl"))
+
+_STOP = object()
+
+
+class WriteSpilled(Exception):
+    """A durable row was not written to the database but spilled to disk; it will be replayed."""
+
+
+class WriteBehindBuffer:
+    """Collects rows in memory and hands them to flush_fn in batches.
+
+    A batch is flushed when it reaches batch_size or flush_interval has passed
+    since its first row, whichever comes first. put() blocks once max_size rows
+    are queued (back-pressure). Durable callers wait until their row's batch
+    is written; everyone else returns as soon as the row is queued.
+
+    Only flush_fn (the durable write) is retried. after_flush(rows, result)
+    runs once per committed batch with flush_fn's result, best effort: its
+    errors are logged, never retried, so a failing side effect can't make
+    flush_fn write the same rows twice.
+    A batch that fails every retry is spilled to spill_path and replayed by
+    the next start() (durable callers get WriteSpilled); load_row turns a
+    spilled JSON row back into a row.
+    """
+
+    def __init__(self, flush_fn, after_flush=None, max_size=WRITE_BUFFER_MAX, batch_size=WRITE_BATCH_SIZE,
+                 flush_interval=WRITE_FLUSH_INTERVAL, max_retries=WRITE_MAX_RETRIES,
+                 spill_path=WRITE_SPILL_PATH, load_row=tuple):
+        self.flush_fn = flush_fn
+        self.after_flush = after_flush
+        self.spill_path = spill_path
+        self.load_row = load_row
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.queue = asyncio.Queue(max_size)
+        self._task = None
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        await self.replay_spilled()
+
+    async def replay_spilled(self):
+        """Re-flush rows spilled by an earlier failure. Rows that fail again are spilled again."""
+        if not self.spill_path: return 0
+        replaying = self.spill_path + ".replaying"
+        if os.path.exists(replaying):
+            # An earlier replay died part way: some of these rows may be in already, leave it to an operator
+            print(f"⚠️ Unfinished write buffer replay left in {replaying}; not replaying it automatically.")
+            return 0
+        if not os.path.exists(self.spill_path): return 0
+        os.replace(self.spill_path, replaying)  # new spills go to a fresh file meanwhile
+        with open(replaying, "r", encoding="utf-8") as f:
+            rows = [self.load_row(json.loads(line)) for line in f if line.strip()]
+        for i in range(0, len(rows), self.batch_size):
+            await self._flush([(row, None) for row in rows[i:i + self.batch_size]])
+        os.remove(replaying)
+        print(f"✅ Write buffer replayed {len(rows)} spilled rows.")
+        return len(rows)
+
+    async def stop(self):
+        """Flush everything still queued, then stop the flusher."""
+        if self._task is None:
+            return
+        await self.queue.put((_STOP, None))
+        await self._task
+        self._task = None
+
+    async def put(self, row, durable=False):
+        if self._task is None:
+            # Buffer not running (e.g. outside the app lifespan): write through
+            await self._after_flush([row], await self.flush_fn([row]))
+            return
+        future = asyncio.get_running_loop().create_future() if durable else None
+        await self.queue.put((row, future))
+        if future is not None:
+            await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            # Someone is waiting on a row: take what's already queued and go
+            urgent = batch[0][1] is not None
+            while len(batch) < self.batch_size and batch[-1][0] is not _STOP:
+                if urgent:
+                    try:
+                        item = self.queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                batch.append(item)
+                urgent = urgent or item[1] is not None
+            if batch[-1][0] is _STOP:
+                stopping = True
+                batch.pop()
+            if batch:
+                await self._flush(batch)
+
+    async def _after_flush(self, rows, result):
+        if self.after_flush is None: return
+        try:
+            await self.after_flush(rows, result)
+        except Exception as e:
+            ERRORS.inc("write_buffer_after_flush")
+            print(f"⚠️ Write buffer post-commit step failed for {len(rows)} rows (rows are stored): {e}")
+
+    def _spill(self, rows):
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(list(row), default=str) + "\n" for row in rows)
+
+    async def _flush(self, batch):
+        rows = [row for row, _ in batch]
+        error = result = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await self.flush_fn(rows)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if attempt < self.max_retries:
+                    await asyncio.sleep(0.1 * (2 ** attempt))
+        if error is None:
+            await self._after_flush(rows, result)
+        else:
+            ERRORS.inc("write_buffer_flush")
+            try:
+                self._spill(rows)
+                print(f"❌ Write buffer flush failed, spilled {len(rows)} rows to {self.spill_path}: {error}")
+                error = WriteSpilled(f"spilled to {self.spill_path} after: {error}")
+            except OSError as e:
+                print(f"❌ Write buffer flush failed and could not spill, lost {len(rows)} rows: {error} ({e})")
+        for _, future in batch:
+            if future is not None and not future.done():
+                if error is None: future.set_result(None)
+                else: future.set_exception(error)